@@ -0,0 +1,178 @@
+import re
+from collections import Counter
+from time import sleep
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webelement import WebElement
+from lbrc_selenium.selenium import (
+    DOCUMENT_READY_SCRIPT, TABLE_EXTRACT_SCRIPT, TEXT_SCRIPT,
+    UNNESTED_ELEMENTS_SCRIPT, unnested_elements,
+)
+from lbrc_selenium.snapshot import DomSnapshot
+
+
+RE_TAG = re.compile(r'<[^\n]*?>')
+
+
+class FakeElement(WebElement):
+    # A WebElement for an element of the fake driver's page, so that the
+    # helper takes the same paths as it would for a browser
+    def __init__(self, driver, element):
+        super().__init__(driver, str(id(element)))
+        self.element = element
+
+    @property
+    def tag_name(self):
+        self._parent.command('getElementTagName')
+        return self.element.tag_name
+
+    @property
+    def text(self):
+        self._parent.command('getElementText')
+        return self.element.text
+
+    def get_attribute(self, name):
+        self._parent.command('getElementAttribute')
+        return self.element.get_attribute(name)
+
+    def get_property(self, name):
+        self._parent.command('getElementProperty')
+        return self.element.get_property(name)
+
+    def is_displayed(self):
+        self._parent.command('isElementDisplayed')
+        return self.element.is_displayed()
+
+    def find_element(self, by=By.ID, value=None):
+        self._parent.command('findChildElement')
+        return self._parent.wrap(self.element.find_element(by, value))
+
+    def find_elements(self, by=By.ID, value=None):
+        self._parent.command('findChildElements')
+        return self._parent.wrap(self.element.find_elements(by, value))
+
+
+class FakeDriver:
+    # Serves an HTML page from memory and waits for latency seconds on
+    # each command, like a driver for a browser on a remote grid.  The
+    # scripts that the helper sends are run in Python against the page.
+    def __init__(self, page_source, current_url='https://example.com/', latency=0):
+        self.latency = latency
+        self.commands = Counter()
+        self.load(page_source, current_url)
+
+    def load(self, page_source, current_url=None):
+        self.snapshot = DomSnapshot(page_source, current_url or self.snapshot.current_url)
+        self._elements = {}
+
+    def command(self, name):
+        self.commands[name] += 1
+
+        if self.latency:
+            sleep(self.latency)
+
+    def command_count(self):
+        return sum(self.commands.values())
+
+    def wrap(self, result):
+        if isinstance(result, list):
+            return [self.wrap(r) for r in result]
+
+        if result not in self._elements:
+            self._elements[result] = FakeElement(self, result)
+
+        return self._elements[result]
+
+    @property
+    def page_source(self):
+        self.command('getPageSource')
+        return self.snapshot.page_source
+
+    @property
+    def current_url(self):
+        self.command('getCurrentUrl')
+        return self.snapshot.current_url
+
+    def get(self, url):
+        self.command('get')
+
+    def find_element(self, by=By.ID, value=None):
+        self.command('findElement')
+        return self.wrap(self.snapshot.find_element(by, value))
+
+    def find_elements(self, by=By.ID, value=None):
+        self.command('findElements')
+        return self.wrap(self.snapshot.find_elements(by, value))
+
+    def execute_script(self, script, *args):
+        self.command('executeScript')
+
+        if script == DOCUMENT_READY_SCRIPT:
+            return True
+        if script == TEXT_SCRIPT:
+            return [text_of(e.element) for e in args[0]]
+        if script == UNNESTED_ELEMENTS_SCRIPT:
+            elements = [e.element for e in args[0]]
+            elements = sorted_by_tag_name(elements) if args[1] else elements
+            return self.wrap(unnested_elements(elements, lambda e: e.parent_element))
+        if script == TABLE_EXTRACT_SCRIPT:
+            return extract_table(args[0].element, args[1])
+
+        raise NotImplementedError('The fake driver cannot run this script')
+
+    def close(self):
+        self.command('closeWindow')
+
+    def quit(self):
+        self.command('quit')
+
+
+# Python versions of the functions in SCRIPT_FUNCTIONS
+
+def find(element, selector):
+    return element.find_elements(By.XPATH if selector['by'] == 'xpath' else By.CSS_SELECTOR, selector['query'])
+
+
+def is_blank(value):
+    return RE_TAG.sub('', value or '').strip() == ''
+
+
+def text_of(element):
+    result = [element.text]
+
+    if is_blank(result[0]):
+        result.append(element.get_attribute('text'))
+
+        if is_blank(result[1]):
+            result.append(element.get_property('innerHTML'))
+
+    return result
+
+
+def contents_of(element):
+    result = {'tag': element.tag_name, 'text': text_of(element)}
+
+    if result['tag'] == 'a':
+        result['href'] = element.get_attribute('href')
+
+    return result
+
+
+def sorted_by_tag_name(elements):
+    return sorted(elements, key=lambda e: e.tag_name)
+
+
+def value_of(element, selector):
+    values = unnested_elements(sorted_by_tag_name(find(element, selector)), lambda e: e.parent_element)
+    value = values[0] if values else None
+
+    return {'resolved': value is not None, 'contents': contents_of(value or element)}
+
+
+def extract_table(parent, selectors):
+    return {
+        'headers': [text_of(h) for h in find(parent, selectors['header'])],
+        'rows': [
+            [value_of(cell, selectors['value']) for cell in find(row, selectors['cell'])]
+            for row in find(parent, selectors['row'])
+        ],
+    }
@@ -0,0 +1,65 @@
+import random
+from html import escape
+
+
+def table_page(rows, columns=6, seed=0):
+    rng = random.Random(seed)
+    headers = ''.join(f'<th>Column {c}</th>' for c in range(columns))
+    body = []
+
+    for r in range(rows):
+        cells = []
+
+        for c in range(columns):
+            value = escape(f'Value {rng.randrange(rows * 10)}')
+
+            if c % 3 == 0:
+                cells.append(f'<td>{value}</td>')
+            elif c % 3 == 1:
+                cells.append(f'<td><span>{value}</span></td>')
+            else:
+                cells.append(f'<td><a href="/participant/{r}">{value}</a></td>')
+
+        body.append(f'<tr>{"".join(cells)}</tr>')
+
+    return f'''<html><head><title>Table</title></head><body>
+<table><thead><tr>{headers}</tr></thead>
+<tbody>{"".join(body)}</tbody></table>
+</body></html>'''
+
+
+def key_value_page(pairs, seed=0):
+    rng = random.Random(seed)
+    items = []
+
+    for p in range(pairs):
+        value = escape(f'Value {rng.randrange(pairs * 10)}')
+
+        if p % 2:
+            items.append(f'<li><strong>Key {p}</strong> <span>{value}</span></li>')
+        else:
+            items.append(f'<li><strong>Key {p}</strong> <a href="/details/{p}">{value}</a></li>')
+
+    return f'''<html><head><title>Details</title></head><body>
+<ul>{"".join(items)}</ul>
+</body></html>'''
+
+
+def items(count, seed=0):
+    rng = random.Random(seed)
+
+    for i in rng.sample(range(count), count):
+        yield {
+            'id': f'P{i:08d}',
+            'group': 'ABCDE'[i % 5],
+            'name': f'Participant {i}',
+            'value': rng.randrange(1000),
+        }
+
+
+def translation_rows(count, columns=20, seed=0):
+    rng = random.Random(seed)
+    keys = [f'Column {c}' for c in range(columns)]
+
+    for _ in range(count):
+        yield {k: rng.choice(['Yes', 'No', 'Unknown', str(rng.randrange(100))]) for k in keys}
@@ -0,0 +1,304 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+from statistics import mean
+from time import perf_counter
+from lbrc_selenium import ItemsFile
+from lbrc_selenium.selenium import KeyValuePairScrubber, SeleniumHelper, TableScrubber, VersionTranslator
+from benchmarks import fixtures
+from benchmarks.fake_driver import FakeDriver
+
+
+SCRUBBER_MODES = {
+    'elements': {},
+    'single_call': {'single_call': True},
+    'snapshot': {'snapshot': True},
+}
+SAMPLING_TYPES = ['10', 'hash', 'reservoir']
+TRANSLATION_VERSIONS = ['1.0', '1.5', '2.0', '2.5', '3.0']
+
+
+def measure(name, parameters, run, repeat, setup=None):
+    # Times run(state) repeat times, each with a new state from setup.
+    # run returns counts, such as the number of items, for the result.
+    runs = []
+
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = perf_counter()
+        counts = run(state)
+        runs.append(perf_counter() - start)
+
+    result = {
+        'name': name,
+        'parameters': parameters,
+        'seconds': min(runs),
+        'mean': mean(runs),
+        'runs': runs,
+        **(counts or {}),
+    }
+
+    if 'items' in result and result['seconds']:
+        result['items_per_second'] = result['items'] / result['seconds']
+
+    logging.info(f'{name} {parameters}: {result["seconds"]:.4f}s')
+
+    return result
+
+
+@contextmanager
+def environment(**values):
+    previous = {k: os.environ.get(k) for k in values}
+    os.environ.update(values)
+
+    try:
+        yield
+    finally:
+        for k, v in previous.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def scrubber_benchmarks(name, scrubber_class, pages, args, directory):
+    # Every mode must return the same details as the first, so that a
+    # mode that scrapes differently fails rather than looking faster
+    for size, page in pages:
+        expected = None
+
+        for mode, options in SCRUBBER_MODES.items():
+            if mode == 'single_call' and scrubber_class is not TableScrubber:
+                continue
+
+            outputs = []
+
+            def setup():
+                driver = FakeDriver(page, latency=args.latency)
+
+                return driver, SeleniumHelper(
+                    driver=driver,
+                    download_directory=directory / 'downloads',
+                    output_directory=directory / 'output',
+                    base_url='https://example.com/',
+                )
+
+            def run(state):
+                driver, helper = state
+                details = scrubber_class(helper, **options).get_details()
+                outputs.append(details)
+
+                return {'items': len(details), 'commands': driver.command_count()}
+
+            result = measure(name, {'size': size, 'mode': mode, 'latency': args.latency}, run, args.repeat, setup)
+
+            for details in outputs:
+                if expected is None:
+                    expected = details
+                elif details != expected:
+                    raise AssertionError(f'{name} returned different details in {mode} mode for size {size}')
+
+            yield result
+
+
+def table_scrubber(args, directory):
+    pages = [(rows, fixtures.table_page(rows)) for rows in args.table_rows]
+    yield from scrubber_benchmarks('table_scrubber', TableScrubber, pages, args, directory)
+
+
+def key_value_scrubber(args, directory):
+    pages = [(pairs, fixtures.key_value_page(pairs)) for pairs in args.pairs]
+    yield from scrubber_benchmarks('key_value_scrubber', KeyValuePairScrubber, pages, args, directory)
+
+
+def items_file(args, directory):
+    for count in args.items:
+        for format in args.formats:
+            yield from items_file_format(args, directory, count, format)
+
+
+def items_file_format(args, directory, count, format):
+    items_directory = directory / f'items_{count}'
+    items_directory.mkdir(exist_ok=True)
+    parameters = {'items': count, 'format': format}
+
+    def filled(_=None):
+        f = ItemsFile(items_directory, 'items', index_fields=['id'], format=format)
+
+        for i in fixtures.items(count):
+            f.add_item(i)
+
+        return f
+
+    def add(_):
+        filled()
+        return {'items': count}
+
+    def save(f):
+        f.save()
+        return {'items': count, 'bytes': f.export_filepath().stat().st_size}
+
+    yield measure('items_file_add', parameters, add, args.repeat)
+    yield measure('items_file_save', parameters, save, args.repeat, filled)
+
+    f = ItemsFile(items_directory, 'items', format=format)
+    rng = random.Random(0)
+    positions = [rng.randrange(count) for _ in range(1000)]
+    ids = [f'P{rng.randrange(count):08d}' for _ in range(1000)]
+
+    def load(_):
+        return {'items': sum(1 for _ in f.get_items())}
+
+    def get_items_at(_):
+        return {'items': sum(1 for _ in f.get_items_at(positions))}
+
+    def find_items(_):
+        return {'items': sum(sum(1 for _ in f.find_items('id', i)) for i in ids)}
+
+    def sample(_):
+        return {'items': sum(1 for _ in f.get_sample_items())}
+
+    yield measure('items_file_load', parameters, load, args.repeat)
+    yield measure('items_file_get_items_at', parameters, get_items_at, args.repeat)
+
+    # Without an index, each search reads the whole file
+    if f.format.indexed:
+        yield measure('items_file_find_items', parameters, find_items, args.repeat)
+
+    for sampling_type in SAMPLING_TYPES:
+        with environment(SAMPLING_TYPE=sampling_type, SAMPLING_FIELDS='id' if sampling_type == 'hash' else ''):
+            yield measure('items_file_sample', {**parameters, 'sampling_type': sampling_type}, sample, args.repeat)
+
+
+def translation(args, directory):
+    translator = VersionTranslator()
+
+    for i, ver in enumerate(TRANSLATION_VERSIONS):
+        translator.set_columns_for_version(ver, {f'column_{c}' for c in range(20 - i)} | {f'Column {c}' for c in range(20)})
+        translator.set_label_translators_for_version(ver, {f'Column {c}': f'column_{c}' for c in range(0, 20, 2)})
+        translator.set_value_translators_for_version(ver, {'Yes': 'Y', 'No': 'N'})
+
+    rows = list(fixtures.translation_rows(args.translation_rows))
+    parameters = {'rows': len(rows), 'versions': len(TRANSLATION_VERSIONS)}
+
+    def translate_dictionary(_):
+        for r in rows:
+            translator.translate_dictionary('2.2', r)
+
+        return {'items': len(rows)}
+
+    def translate_dictionaries(_):
+        return {'items': sum(1 for _ in translator.translate_dictionaries('2.2', rows))}
+
+    yield measure('translate_dictionary', parameters, translate_dictionary, args.repeat)
+    yield measure('translate_dictionaries', parameters, translate_dictionaries, args.repeat)
+
+
+BENCHMARKS = {
+    'table_scrubber': table_scrubber,
+    'key_value_scrubber': key_value_scrubber,
+    'items_file': items_file,
+    'translation': translation,
+}
+
+
+def result_key(result):
+    return result['name'], json.dumps(result['parameters'], sort_keys=True)
+
+
+def compare(previous, current, threshold):
+    # Lists the results that are slower, or send more commands, than
+    # before by more than threshold times, and returns how many there are
+    before = {result_key(r): r for r in previous['results']}
+    regressions = 0
+
+    for r in current['results']:
+        p = before.get(result_key(r))
+
+        if p is None:
+            continue
+
+        ratio = r['seconds'] / p['seconds'] if p['seconds'] else 1
+        more_commands = r.get('commands', 0) > p.get('commands', 0)
+        regressed = ratio > threshold or more_commands
+        regressions += regressed
+
+        print(
+            f'{"REGRESSED " if regressed else ""}{r["name"]} {r["parameters"]}: '
+            f'{p["seconds"]:.4f}s -> {r["seconds"]:.4f}s ({ratio:.2f}x)'
+            + (f', {p["commands"]} -> {r["commands"]} commands' if 'commands' in r and 'commands' in p else ''),
+            file=sys.stderr,
+        )
+
+    return regressions
+
+
+def integers(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def names(value):
+    return [v for v in value.split(',') if v]
+
+
+def version():
+    try:
+        return metadata.version('lbrc_selenium')
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for lbrc_selenium')
+    parser.add_argument('--only', action='append', choices=BENCHMARKS.keys(), help='Benchmarks to run (default: all)')
+    parser.add_argument('--output', type=Path, help='File for the JSON results (default: stdout)')
+    parser.add_argument('--compare', type=Path, help='Results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Slow down that counts as a regression (default: 1.2)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.001, help='Seconds the fake driver waits for each command (default: 0.001)')
+    parser.add_argument('--table-rows', type=integers, default=[100, 1000])
+    parser.add_argument('--pairs', type=integers, default=[100, 1000])
+    parser.add_argument('--items', type=integers, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--formats', type=names, default=['jsonl'], help='Comma separated ItemsFile formats (default: jsonl)')
+    parser.add_argument('--translation-rows', type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+
+    results = {
+        'lbrc_selenium': version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'threshold')},
+        'results': [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.only or BENCHMARKS:
+            results['results'].extend(BENCHMARKS[name](args, Path(directory)))
+
+    output = json.dumps(results, indent=2, default=str)
+
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+
+    if args.compare:
+        return 1 if compare(json.loads(args.compare.read_text()), results, args.threshold) else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,78 @@
 import dataclasses
+import hashlib
+import heapq
+import importlib
+import json
 import logging
+import mmap
 import shutil
 import math
 import os
+import random
+import tempfile
+from array import array
+from itertools import chain, islice
+from pathlib import Path
 import jsonlines
-from werkzeug.utils import secure_filename
+from lbrc_selenium.atomic import atomic_write
+from lbrc_selenium.formats import encode_line, get_format
+
+
+# Imported when first used, so that using ItemsFile does not load Selenium
+LAZY_ATTRIBUTES = {
+    'CrawlItem': 'lbrc_selenium.pool',
+    'SeleniumHelper': 'lbrc_selenium.selenium',
+    'SeleniumHelperPool': 'lbrc_selenium.pool',
+    'VersionTranslator': 'lbrc_selenium.selenium',
+    'get_selenium': 'lbrc_selenium.selenium',
+}
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(LAZY_ATTRIBUTES[name]), name)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def item_sort_key(item):
+    return list(item.values())
+
+
+def sorted_items(items, key, buffer_size, directory):
+    items = iter(items)
+    run = list(islice(items, buffer_size + 1))
+
+    if len(run) <= buffer_size:
+        yield from sorted(run, key=key)
+        return
+
+    # Too many items to sort at once, so write sorted runs of
+    # buffer_size items to disk and merge them.  Both sorts are
+    # stable, so the output is the same as sorting in memory.
+    items = chain(run, items)
+    del run
+
+    with tempfile.TemporaryDirectory(dir=directory) as run_directory:
+        run_filepaths = []
+
+        while run := sorted(islice(items, buffer_size), key=key):
+            run_filepath = Path(run_directory) / f'{len(run_filepaths)}.jsonl'
+
+            with jsonlines.open(run_filepath, mode='w') as writer:
+                writer.write_all(run)
+
+            run_filepaths.append(run_filepath)
+
+        del run
+
+        readers = [jsonlines.open(rf) for rf in run_filepaths]
+
+        try:
+            yield from heapq.merge(*readers, key=key)
+        finally:
+            for r in readers:
+                r.close()
 
 
 # Helpers
@@ -12,9 +80,20 @@ class Sampler:
     TYPE_ALL = 'all'
     TYPE_FIBONACCI = 'fibonacci'
     TYPE_FIRST = 'first'
+    TYPE_HASH = 'hash'
+    TYPE_RESERVOIR = 'reservoir'
+    TYPE_STRATIFIED = 'stratified'
+
+    def __init__(self, sampling_type=None, percent=None, size=None, fields=None, seed=None):
+        self.sampling_type = sampling_type or os.environ.get("SAMPLING_TYPE", self.TYPE_ALL)
+        self.percent = float(percent if percent is not None else os.environ.get("SAMPLING_PERCENT", 10))
+        self.size = int(size if size is not None else os.environ.get("SAMPLING_SIZE", 100))
+        self.seed = seed if seed is not None else os.environ.get("SAMPLING_SEED", '0')
 
-    def __init__(self):
-        self.sampling_type = os.environ.get("SAMPLING_TYPE", self.TYPE_ALL)
+        if fields is None:
+            fields = [f.strip() for f in os.environ.get("SAMPLING_FIELDS", '').split(',') if f.strip()]
+
+        self.fields = list(fields)
 
     def is_sampling_pick(self, n):
         is_perfect_square = lambda x: int(math.sqrt(x))**2 == x
@@ -34,23 +113,265 @@ class Sampler:
         else:
             return is_perfect_square(5*n*n + 4) or is_perfect_square(5*n*n - 4)
 
+    def needs_content(self):
+        if self.sampling_type == Sampler.TYPE_STRATIFIED:
+            return True
+
+        return self.sampling_type == Sampler.TYPE_HASH and bool(self.fields)
+
+    def sample_key(self, item):
+        return json.dumps([item.get(f) for f in self.fields], sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+
+    def is_hash_pick(self, key):
+        # The same key is always picked, or not, whatever the position
+        # of its item, so samples are stable across versions
+        h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big')
+        return (h % 1_000_000) < self.percent * 10_000
+
+    def sample_lines(self, lines, filter=None):
+        # Takes lines of JSON and yields the sampled items.  Lines are
+        # only decoded when the filter or the sampling type needs their
+        # contents, or when they are picked.
+        lines = (l for l in lines if l.strip())
+
+        if filter or self.needs_content():
+            entries = ((l, json.loads(l)) for l in lines)
+            entries = ((l, i) for l, i in entries if not filter or filter(i))
+        else:
+            entries = ((l, None) for l in lines)
+
+        decode = lambda line, item: json.loads(line) if item is None else item
+        line_of = lambda line, item: line.strip()
+
+        yield from self._sample(entries, decode, line_of)
+
+    def sample_items(self, items, filter=None):
+        # For files without lines of JSON.  Hash sampling without fields
+        # hashes the line that jsonlines would write for the item, so the
+        # sample is the same as for a JSONL file.
+        entries = ((None, i) for i in items if not filter or filter(i))
+        decode = lambda line, item: item
+        line_of = lambda line, item: encode_line(item).encode('utf-8')
+
+        yield from self._sample(entries, decode, line_of)
+
+    def _sample(self, entries, decode, line_of):
+        if self.sampling_type == Sampler.TYPE_HASH:
+            for line, item in entries:
+                key = self.sample_key(item) if self.fields else line_of(line, item)
+
+                if self.is_hash_pick(key):
+                    yield decode(line, item)
+
+        elif self.sampling_type == Sampler.TYPE_RESERVOIR:
+            for line, item in self._reservoir(entries):
+                yield decode(line, item)
+
+        elif self.sampling_type == Sampler.TYPE_STRATIFIED:
+            # Only the picks of each stratum are held in memory
+            strata = {}
+
+            for n, (line, item) in enumerate(entries):
+                key = self.sample_key(item)
+
+                if key not in strata:
+                    strata[key] = self._new_reservoir(seed=key)
+
+                strata[key].add((n, item))
+
+            picked = chain.from_iterable(r.entries() for r in strata.values())
+
+            for _, item in sorted(picked, key=lambda p: p[0]):
+                yield item
+
+        else:
+            for n, (line, item) in enumerate(entries):
+                if self.is_sampling_pick(n):
+                    yield decode(line, item)
+                elif self.sampling_type == Sampler.TYPE_FIRST:
+                    return
+
+    def _new_reservoir(self, seed=b''):
+        # Seeded so that the same file gives the same sample
+        return Reservoir(self.size, f'{self.seed}:'.encode('utf-8') + seed)
+
+    def _reservoir(self, entries, seed=b''):
+        reservoir = self._new_reservoir(seed)
+
+        for entry in entries:
+            reservoir.add(entry)
+
+        return reservoir.entries()
+
+
+class Reservoir():
+    # Algorithm R.  Keeps size of the entries added, each equally likely.
+    def __init__(self, size, seed):
+        self.size = size
+        self.count = 0
+        self._rng = random.Random(seed)
+        self._picked = []
+
+    def add(self, entry):
+        if self.count < self.size:
+            self._picked.append((self.count, entry))
+        else:
+            j = self._rng.randrange(self.count + 1)
+
+            if j < self.size:
+                self._picked[j] = (self.count, entry)
+
+        self.count += 1
+
+    def entries(self):
+        # The picked entries in the order they were added
+        return [entry for _, entry in sorted(self._picked, key=lambda r: r[0])]
+
+
+class ItemsIndex():
+    def __init__(self, fields=None):
+        self.fields = list(fields or [])
+        self.offsets = array('Q')
+        self.keys = {f: {} for f in self.fields}
+
+    @staticmethod
+    def key(value):
+        return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+    def add(self, offset, item):
+        position = len(self.offsets)
+        self.offsets.append(offset)
+
+        for f in self.fields:
+            if f in item:
+                self.keys[f].setdefault(self.key(item[f]), []).append(position)
+
+    def find(self, field, value):
+        return self.keys[field].get(self.key(value), [])
+
+    @staticmethod
+    def offsets_filepath(export_filepath):
+        return export_filepath.with_name(export_filepath.name + '.idx')
+
+    @staticmethod
+    def keys_filepath(export_filepath):
+        return export_filepath.with_name(export_filepath.name + '.keys.json')
+
+    @staticmethod
+    def stamp(export_filepath):
+        # The index is only used for the export it was saved with, so an
+        # export rewritten at the same size is not read with stale offsets
+        stat = export_filepath.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def save(self, export_filepath):
+        stamp = self.stamp(export_filepath)
+
+        with open(self.offsets_filepath(export_filepath), 'wb') as f:
+            (self.offsets + array('Q', stamp)).tofile(f)
+
+        keys_filepath = self.keys_filepath(export_filepath)
+
+        if self.fields:
+            with open(keys_filepath, 'w', encoding='utf-8') as f:
+                json.dump({'stamp': stamp, 'keys': self.keys}, f, ensure_ascii=False)
+        elif keys_filepath.exists():
+            keys_filepath.unlink()
+
+    @classmethod
+    def load(cls, export_filepath):
+        stamp = cls.stamp(export_filepath)
+        result = cls()
+
+        offsets_filepath = cls.offsets_filepath(export_filepath)
+
+        if offsets_filepath.exists():
+            with open(offsets_filepath, 'rb') as f:
+                result.offsets.frombytes(f.read())
+
+        if result.offsets[-2:] == array('Q', stamp):
+            del result.offsets[-2:]
+        else:
+            # Missing or stale index, so find the line starts again
+            result.offsets = array('Q')
+            offset = 0
+
+            with open(export_filepath, 'rb') as f:
+                for line in f:
+                    result.offsets.append(offset)
+                    offset += len(line)
+
+        keys_filepath = cls.keys_filepath(export_filepath)
+
+        if keys_filepath.exists():
+            with open(keys_filepath, encoding='utf-8') as f:
+                keys = json.load(f)
+
+            if keys.get('stamp') == stamp:
+                result.keys = keys['keys']
+                result.fields = list(result.keys.keys())
+
+        return result
+
+
+class IndexedWriter():
+    def __init__(self, filepath, index, mode='w', format=None):
+        # index is None for formats that cannot be indexed
+        self.index = index
+        self._writer = get_format(format or 'jsonl').writer(filepath, mode)
+
+        if self.index is not None:
+            self._offset = self._writer.tell()
+
+    def write(self, item):
+        if self.index is None:
+            self._writer.write(item)
+            return
+
+        self.index.add(self._offset, item)
+        self._offset += self._writer.write(item)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 class ItemFileGroup():
-    def __init__(self, helper, output_directory, filename_template, sorted=True):
+    def __init__(self, helper, output_directory, filename_template, sorted=True, stream=False, sort_buffer_size=None, index_fields=None, format=None, journal=None):
         self.helper = helper
         self.output_directory = output_directory
         self.filename_template = filename_template
         self.sorted = sorted
+        self.stream = stream
+        self.sort_buffer_size = sort_buffer_size
+        self.index_fields = index_fields
+        self.format = format
+        self.journal = journal
 
-    def get_file(self, template_arguments=None):
-        self.output_directory.mkdir(parents=True, exist_ok=True)
-
+    def get_filename(self, template_arguments=None):
         if template_arguments:
-            filename = self.filename_template.format(**template_arguments)
+            return self.filename_template.format(**template_arguments)
         else:
-            filename = self.filename_template
+            return self.filename_template
 
-        return ItemsFile(self.output_directory, filename, sorted=self.sorted)
+    def get_file(self, template_arguments=None):
+        self.output_directory.mkdir(parents=True, exist_ok=True)
+
+        return ItemsFile(
+            self.output_directory,
+            self.get_filename(template_arguments),
+            sorted=self.sorted,
+            stream=self.stream,
+            sort_buffer_size=self.sort_buffer_size,
+            index_fields=self.index_fields,
+            format=self.format,
+            journal=self.journal,
+        )
 
     def clean(self):
         if os.path.exists(self.output_directory):
@@ -58,57 +379,292 @@ class ItemFileGroup():
 
 
 class ItemsFile():
-    def __init__(self, output_directory, filename, sorted=True):
+    def __init__(self, output_directory, filename, sorted=True, stream=False, sort_buffer_size=None, index_fields=None, format=None, journal=None):
         self.output_directory = output_directory
         self.filename = filename
         self.items = []
         self.sorted = sorted
+        self.stream = stream
+        self.sort_buffer_size = sort_buffer_size or int(os.environ.get("SORT_BUFFER_SIZE", 100_000))
+        self.index_fields = index_fields
+        self.format = get_format(format)
+        self.journal = journal if journal is not None else bool(os.environ.get("ITEMS_JOURNAL", False))
+        self.completed = set()
+        self._item_hashes = set()
+        self._writer = None
+        self._streamed = False
+        self._stream_index = None
+        self._index = None
+        self._journal_fp = None
+        self._journal_writer = None
+
+        if self.journal:
+            self._replay_journal()
 
     def _export_filename(self):
-        return secure_filename(f'{self.filename}.jsonl')
+        from werkzeug.utils import secure_filename
+
+        return secure_filename(f'{self.filename}.{self.format.extension}')
 
     def export_filepath(self):
         return self.output_directory / self._export_filename()
 
+    def _stream_filepath(self):
+        return self.export_filepath().with_name(self._export_filename() + '.stream')
+
+    def _item_hash(self, item):
+        canonical = json.dumps(item, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+    def _journal_filepath(self):
+        return self.export_filepath().with_name(self._export_filename() + '.journal')
+
     def add_item(self, item):
-        if item not in self.items:
+        if self._add(item) and self.journal:
+            self._journal_write({'item': item})
+
+    def _add(self, item):
+        h = self._item_hash(item)
+
+        if h in self._item_hashes:
+            return False
+
+        self._item_hashes.add(h)
+
+        if self.stream:
+            self._stream_writer().write(item)
+        else:
             self.items.append(item)
 
+        return True
+
+    def checkpoint(self, key):
+        # Records in the journal that the items for key, such as a page,
+        # have all been added, so that a resumed run can skip it
+        if not self.journal:
+            return
+
+        self._journal_write({'checkpoint': key})
+        self._journal_fp.flush()
+        os.fsync(self._journal_fp.fileno())
+        self.completed.add(key)
+
+    def is_complete(self, key):
+        return key in self.completed
+
+    def _journal_write(self, record):
+        if self._journal_writer is None:
+            self.output_directory.mkdir(parents=True, exist_ok=True)
+            self._journal_fp = open(self._journal_filepath(), 'ab')
+            self._journal_writer = jsonlines.Writer(self._journal_fp)
+
+        self._journal_writer.write(record)
+
+    def _replay_journal(self):
+        # Adds the items and checkpoints of an earlier run that died.
+        # Items after the last checkpoint belong to a page that will be
+        # scraped again, so are dropped and cut from the journal, along
+        # with any partly written record.
+        filepath = self._journal_filepath()
+
+        if not filepath.exists():
+            return
+
+        pending = []
+        offset = 0
+        end = 0
+
+        with open(filepath, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+
+                offset += len(line)
+
+                if 'checkpoint' in record:
+                    for i in pending:
+                        self._add(i)
+
+                    pending = []
+                    self.completed.add(record['checkpoint'])
+                    end = offset
+                else:
+                    pending.append(record['item'])
+
+        os.truncate(filepath, end)
+
+        logging.info(f'Resumed {len(self._item_hashes)} items and {len(self.completed)} checkpoints from {filepath}')
+
+    def _remove_journal(self):
+        # The export now holds every item, so the journal is no longer
+        # needed
+        if self._journal_writer is not None:
+            self._journal_writer.close()
+            self._journal_fp.close()
+            self._journal_writer = None
+            self._journal_fp = None
+
+        self._journal_filepath().unlink(missing_ok=True)
+
     def exists(self):
         return (self.export_filepath()).exists()
 
-    def save(self):
-        with jsonlines.open(self.export_filepath(), mode='w') as writer:
-            if self.sorted:
-                for i in sorted(self.items, key=lambda i: list(i.values())):
-                    writer.write(i)
-            else:
-                for i in self.items:
+    def _new_index(self):
+        return ItemsIndex(self.index_fields) if self.format.indexed else None
+
+    def _write_export(self, items):
+        index = self._new_index()
+
+        with atomic_write(self.export_filepath()) as partial_filepath:
+            with IndexedWriter(partial_filepath, index, format=self.format) as writer:
+                for i in items:
                     try:
                         writer.write(i)
                     except Exception as e:
                         print(i)
                         raise e
 
-    def get_items(self, filter=None):
-        with jsonlines.open(self.export_filepath()) as reader:
-            for item in reader:
-                if filter and not filter(item):
-                    continue
+        self._save_index(index)
 
-                yield item
+    def save(self):
+        if self.stream:
+            self._save_stream()
+        elif self.sorted:
+            self._write_export(self._sorted_items(self.items))
+        else:
+            self._write_export(self.items)
 
-    def get_sample_items(self, filter=None, sample_all=False):
-        sampler = Sampler()
+        if self.journal:
+            self._remove_journal()
+
+    def _stream_writer(self):
+        # Items are streamed to a separate file, which becomes the export
+        # when saved.  Items added after a save are appended to a copy of
+        # the export.
+        if self._writer is None:
+            if not self._streamed:
+                self._stream_index = self._new_index()
+            elif self.exists():
+                shutil.copyfile(self.export_filepath(), self._stream_filepath())
+
+            self._writer = IndexedWriter(self._stream_filepath(), self._stream_index, mode='a' if self._streamed else 'w', format=self.format)
+            self._streamed = True
+
+        return self._writer
+
+    def _save_stream(self):
+        self._stream_writer().close()
+        self._writer = None
+
+        if not self.sorted:
+            os.replace(self._stream_filepath(), self.export_filepath())
+            self._save_index(self._stream_index)
+            return
+
+        try:
+            self._write_export(self._sorted_items(self.format.read(self._stream_filepath())))
+        finally:
+            self._stream_filepath().unlink(missing_ok=True)
+
+    def _save_index(self, index):
+        if index is not None:
+            index.save(self.export_filepath())
+        else:
+            ItemsIndex.offsets_filepath(self.export_filepath()).unlink(missing_ok=True)
+            ItemsIndex.keys_filepath(self.export_filepath()).unlink(missing_ok=True)
+
+        self._index = None
+
+    def get_index(self):
+        if self._index is None:
+            self._index = ItemsIndex.load(self.export_filepath())
+
+        return self._index
+
+    def count(self):
+        if not self.format.indexed:
+            return sum(1 for _ in self.get_items())
+
+        return len(self.get_index().offsets)
+
+    def get_item(self, position):
+        return next(self.get_items_at([position]))
+
+    def get_items_at(self, positions):
+        if not self.format.indexed:
+            yield from self._scan_items_at(positions)
+            return
 
-        with jsonlines.open(self.export_filepath()) as reader:
-            n = 0
+        offsets = self.get_index().offsets
+        size = self.export_filepath().stat().st_size
 
-            for item in reader:
-                if filter and not filter(item):
-                    continue
+        if size == 0:
+            for p in positions:
+                raise IndexError(p)
 
-                if sample_all or sampler.is_sampling_pick(n):
-                    yield item
-                    
-                n += 1
+            return
+
+        with open(self.export_filepath(), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for p in positions:
+                if p < 0:
+                    raise IndexError(p)
+
+                start = offsets[p]
+                end = offsets[p + 1] if p + 1 < len(offsets) else size
+
+                yield json.loads(m[start:end])
+
+    def _scan_items_at(self, positions):
+        # Without an index, reads the file once for all the positions
+        positions = list(positions)
+        wanted = set(positions)
+        found = {}
+
+        if not wanted:
+            return
+
+        for n, item in enumerate(self.get_items()):
+            if n in wanted:
+                found[n] = item
+
+                if len(found) == len(wanted):
+                    break
+
+        for p in positions:
+            if p not in found:
+                raise IndexError(p)
+
+            yield found[p]
+
+    def find_items(self, field, value):
+        index = self.get_index() if self.format.indexed else None
+
+        if index is not None and field in index.keys:
+            yield from self.get_items_at(index.find(field, value))
+        else:
+            yield from self.get_items(lambda i: field in i and i[field] == value)
+
+    def _sorted_items(self, items):
+        return sorted_items(items, item_sort_key, self.sort_buffer_size, self.output_directory)
+
+    def get_items(self, filter=None):
+        for item in self.format.read(self.export_filepath()):
+            if filter and not filter(item):
+                continue
+
+            yield item
+
+    def get_sample_items(self, filter=None, sample_all=False):
+        if sample_all:
+            yield from self.get_items(filter)
+            return
+
+        if self.format.has_lines:
+            yield from Sampler().sample_lines(self.format.read_lines(self.export_filepath()), filter)
+        else:
+            yield from Sampler().sample_items(self.format.read(self.export_filepath()), filter)
@@ -0,0 +1,25 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def atomic_write(filepath, unique=False):
+    # Yields a partial path beside filepath to write to.  The partial file
+    # replaces filepath once the block completes, so that readers never
+    # see half a file, and is removed if the block fails.  unique partial
+    # names allow several threads or processes to write the same file.
+    filepath = Path(filepath)
+
+    if unique:
+        partial_filepath = filepath.with_name(f'{filepath.name}.{os.getpid()}.{threading.get_ident()}.part')
+    else:
+        partial_filepath = filepath.with_name(f'{filepath.name}.part')
+
+    try:
+        yield partial_filepath
+        os.replace(partial_filepath, filepath)
+
+    finally:
+        partial_filepath.unlink(missing_ok=True)
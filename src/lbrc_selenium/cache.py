@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from lbrc_selenium.atomic import atomic_write
+
+
+# Changing this invalidates every cached result
+CACHE_FORMAT = 1
+
+
+def cache_key(*parts):
+    canonical = json.dumps([CACHE_FORMAT, *parts], sort_keys=True, ensure_ascii=False, default=_configuration)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _configuration(value):
+    if hasattr(value, '__dict__'):
+        return {'type': type(value).__qualname__, **vars(value)}
+
+    return str(value)
+
+
+class ScrapeCache:
+    # Results stored on disk by key, one file each.  Reading a result
+    # touches its file, so that the least recently used results are
+    # removed first once the cache is larger than max_size bytes.
+    def __init__(self, directory, max_size):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def filepath(self, key):
+        return self.directory / key[:2] / f'{key}.json'
+
+    def get(self, key):
+        # Returns whether the key was found, and its result
+        filepath = self.filepath(key)
+
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                result = json.load(f, object_pairs_hook=OrderedDict)['result']
+
+            os.utime(filepath)
+
+        except (FileNotFoundError, ValueError, KeyError):
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        return True, result
+
+    def put(self, key, result):
+        filepath = self.filepath(key)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            # Sized before the new file is added, so that it is only
+            # counted once
+            self._current_size()
+
+            try:
+                replaced_size = filepath.stat().st_size
+            except FileNotFoundError:
+                replaced_size = 0
+
+            with atomic_write(filepath, unique=True) as partial_filepath:
+                with open(partial_filepath, 'w', encoding='utf-8') as f:
+                    json.dump({'result': result}, f, ensure_ascii=False)
+
+                size = partial_filepath.stat().st_size
+
+            self._size += size - replaced_size
+
+            if self._size > self.max_size:
+                self._evict()
+
+    def _entries(self):
+        for filepath in self.directory.glob('*/*.json'):
+            try:
+                stat = filepath.stat()
+                yield stat.st_mtime, stat.st_size, filepath
+            except FileNotFoundError:
+                pass
+
+    def _current_size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+        return self._size
+
+    def _evict(self):
+        # Removes down to 90% of max_size, so that the directory is not
+        # scanned again on every put
+        target = self.max_size * 0.9
+        size = 0
+        removed = 0
+
+        for _, entry_size, filepath in sorted(self._entries(), reverse=True):
+            if removed == 0 and size + entry_size <= target:
+                size += entry_size
+            else:
+                filepath.unlink(missing_ok=True)
+                removed += 1
+
+        self._size = size
+        logging.debug(f'Removed {removed} results from the scrape cache')
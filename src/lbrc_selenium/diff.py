@@ -0,0 +1,248 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from itertools import groupby
+from pathlib import Path
+import jsonlines
+from lbrc_selenium import item_sort_key, sorted_items
+from lbrc_selenium.atomic import atomic_write
+from lbrc_selenium.formats import format_for
+
+
+@dataclass
+class DiffSummary:
+    filename: str
+    old_count: int = 0
+    new_count: int = 0
+    added: int = 0
+    removed: int = 0
+    changed: int = 0
+    unchanged: int = 0
+
+
+def key_function(key_fields):
+    # Without key fields, items are matched on all their values, in the
+    # order that ItemsFile.save sorts them, so they can only be added or
+    # removed.  With key fields, items with the same key are changed.
+    if not key_fields:
+        return item_sort_key
+
+    return lambda item: [json.dumps(item.get(f), sort_keys=True, ensure_ascii=False, default=str) for f in key_fields]
+
+
+def read_items(filepath):
+    if filepath is None or not filepath.exists():
+        return
+
+    yield from format_for(filepath).read(filepath)
+
+
+def grouped(items, key, name):
+    previous = None
+
+    for k, group in groupby(items, key=key):
+        if previous is not None and k < previous:
+            raise ValueError(f'The {name} items are not sorted')
+
+        previous = k
+        yield k, list(group)
+
+
+def diff_items(old_items, new_items, key):
+    # Merge-joins two streams that are both sorted by key and yields
+    # (type, key, old item, new item) for every item
+    old_groups = grouped(old_items, key, 'old')
+    new_groups = grouped(new_items, key, 'new')
+
+    old = next(old_groups, None)
+    new = next(new_groups, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            for i in old[1]:
+                yield 'removed', old[0], i, None
+
+            old = next(old_groups, None)
+
+        elif old is None or new[0] < old[0]:
+            for i in new[1]:
+                yield 'added', new[0], None, i
+
+            new = next(new_groups, None)
+
+        else:
+            yield from match(old[0], old[1], new[1])
+
+            old = next(old_groups, None)
+            new = next(new_groups, None)
+
+
+def match(key, old_items, new_items):
+    new_left = list(new_items)
+    old_left = []
+
+    for i in old_items:
+        if i in new_left:
+            new_left.remove(i)
+            yield 'unchanged', key, i, i
+        else:
+            old_left.append(i)
+
+    if len(old_left) == 1 and len(new_left) == 1:
+        yield 'changed', key, old_left[0], new_left[0]
+        return
+
+    for i in old_left:
+        yield 'removed', key, i, None
+
+    for i in new_left:
+        yield 'added', key, None, i
+
+
+def changed_fields(old, new):
+    return [k for k in dict.fromkeys([*new, *old]) if old.get(k) != new.get(k)]
+
+
+def diff_files(old_filepath, new_filepath, output_filepath, key_fields=None, sort_buffer_size=None):
+    # Writes the added, removed and changed items to output_filepath as
+    # JSONL, and their counts to a summary beside it
+    old_filepath = Path(old_filepath) if old_filepath else None
+    new_filepath = Path(new_filepath) if new_filepath else None
+    output_filepath = Path(output_filepath)
+    output_filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    key = key_function(key_fields)
+    sort_buffer_size = sort_buffer_size or int(os.environ.get("SORT_BUFFER_SIZE", 100_000))
+    summary = DiffSummary(filename=output_filepath.name)
+
+    old_items = read_items(old_filepath)
+    new_items = read_items(new_filepath)
+
+    if key_fields:
+        old_items = sorted_items(old_items, key, sort_buffer_size, output_filepath.parent)
+        new_items = sorted_items(new_items, key, sort_buffer_size, output_filepath.parent)
+
+    with atomic_write(output_filepath) as partial_filepath:
+        with jsonlines.open(partial_filepath, mode='w') as writer:
+            for change, k, old, new in diff_items(old_items, new_items, key):
+                summary.old_count += old is not None
+                summary.new_count += new is not None
+                setattr(summary, change, getattr(summary, change) + 1)
+
+                if change == 'unchanged':
+                    continue
+
+                record = {'type': change}
+
+                if key_fields:
+                    record['key'] = {f: (new or old).get(f) for f in key_fields}
+                if old is not None:
+                    record['old'] = old
+                if new is not None:
+                    record['new'] = new
+                if change == 'changed':
+                    record['fields'] = changed_fields(old, new)
+
+                writer.write(record)
+
+    with open(summary_filepath(output_filepath), 'w', encoding='utf-8') as f:
+        json.dump(asdict(summary), f, indent=2)
+
+    return summary
+
+
+def summary_filepath(output_filepath):
+    return output_filepath.with_name(output_filepath.name + '.summary.json')
+
+
+def exports(directory):
+    # The exports in a directory by their name without the extension, so
+    # that exports saved in different formats are still compared
+    result = {}
+
+    if directory.exists():
+        for p in directory.iterdir():
+            f = format_for(p)
+
+            if f is not None and p.is_file():
+                result[p.name[:-len(f.extension) - 1]] = p
+
+    return result
+
+
+def diff_directories(old_directory, new_directory, output_directory, key_fields=None, workers=None, sort_buffer_size=None):
+    # Diffs the exports of the same name in each directory, one process
+    # per file, and returns their summaries by filename.  Exports only in
+    # one directory are all added or all removed.
+    old_directory = Path(old_directory)
+    new_directory = Path(new_directory)
+    output_directory = Path(output_directory)
+    output_directory.mkdir(parents=True, exist_ok=True)
+
+    old_exports = exports(old_directory)
+    new_exports = exports(new_directory)
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {
+            f'{name}.jsonl': executor.submit(
+                diff_files,
+                old_exports.get(name),
+                new_exports.get(name),
+                output_directory / f'{name}.jsonl',
+                key_fields,
+                sort_buffer_size,
+            )
+            for name in sorted(old_exports.keys() | new_exports.keys())
+        }
+
+        summaries = {f: future.result() for f, future in futures.items()}
+
+    for f, s in summaries.items():
+        logging.info(f'{f}: {s.added} added, {s.removed} removed, {s.changed} changed')
+
+    with open(output_directory / 'summary.json', 'w', encoding='utf-8') as f:
+        json.dump({f: asdict(s) for f, s in summaries.items()}, f, indent=2)
+
+    return summaries
+
+
+def diff_group(group, output_directory=None, key_fields=None, workers=None):
+    # Diffs the files of an ItemFileGroup against the same files for the
+    # helper's compare_version
+    helper = group.helper
+    relative = Path(group.output_directory).relative_to(helper.output_directory)
+    old_directory = helper.global_output_directory / helper.compare_version / relative
+
+    if output_directory is None:
+        output_directory = helper.global_output_directory / 'diff' / f'{helper.compare_version}-{helper.version}' / relative
+
+    return diff_directories(
+        old_directory,
+        group.output_directory,
+        output_directory,
+        key_fields=key_fields,
+        workers=workers,
+        sort_buffer_size=group.sort_buffer_size,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Diffs the exports of two versions')
+    parser.add_argument('old_directory', type=Path)
+    parser.add_argument('new_directory', type=Path)
+    parser.add_argument('output_directory', type=Path)
+    parser.add_argument('--key', action='append', dest='key_fields', help='Field that identifies an item')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    diff_directories(args.old_directory, args.new_directory, args.output_directory, args.key_fields, args.workers)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
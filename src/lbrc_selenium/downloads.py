@@ -0,0 +1,277 @@
+import hashlib
+import logging
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import monotonic
+from selenium.common.exceptions import NoSuchWindowException, TimeoutException
+
+
+# Suffixes of the files browsers write to while a download is in progress
+PARTIAL_SUFFIXES = ('.part', '.crdownload', '.download', '.tmp')
+
+DOWNLOADS_SCRIPT = (
+    "return  document.querySelector('downloads-manager')  "
+    " .shadowRoot.querySelector('#downloadsList')         "
+    " .items.filter(e => e.state === 'COMPLETE')          "
+    " .map(e => e.filePath || e.file_path || e.fileUrl || e.file_url); "
+)
+
+
+class DownloadTracker:
+    def wait(self, seconds_to_wait):
+        raise NotImplementedError()
+
+    def save(self, path, filename):
+        raise NotImplementedError()
+
+    def finish(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class GridDownloadTracker(DownloadTracker):
+    # Watches chrome://downloads in a tab of its own, so that the page in
+    # the helper's tab is left as it was.  The tab is opened by the first
+    # wait and kept until closed, so later downloads only switch tabs
+    # rather than loading the downloads page again.
+    def __init__(self, helper):
+        self.helper = helper
+        self._seen = set()
+        self._downloads_handle = None
+        self._working_handle = None
+
+    def wait(self, seconds_to_wait):
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = self.helper.driver
+
+        if self._working_handle is None:
+            self._working_handle = driver.current_window_handle
+            self._switch_to_downloads(driver)
+
+        files = WebDriverWait(driver, seconds_to_wait, poll_frequency=self.helper.poll_frequency).until(
+            lambda d: [f for f in d.execute_script(DOWNLOADS_SCRIPT) if f not in self._seen]
+        )
+
+        self._seen.update(files)
+
+        return files
+
+    def save(self, path, filename):
+        self.helper.save_file_content(self.helper.driver, path, filename)
+
+    def _switch_to_downloads(self, driver):
+        if self._downloads_handle is not None:
+            try:
+                driver.switch_to.window(self._downloads_handle)
+                return
+            except NoSuchWindowException:
+                logging.debug('Downloads tab was closed, so opening it again')
+
+        driver.switch_to.new_window('tab')
+        driver.get('chrome://downloads/')
+        self._downloads_handle = driver.current_window_handle
+
+    def finish(self):
+        if self._working_handle is None:
+            return
+
+        try:
+            self.helper.driver.switch_to.window(self._working_handle)
+        finally:
+            self._working_handle = None
+
+    def close(self):
+        if self._downloads_handle is None:
+            return
+
+        driver = self.helper.driver
+        current_handle = driver.current_window_handle
+
+        try:
+            driver.switch_to.window(self._downloads_handle)
+            driver.close()
+        finally:
+            if current_handle != self._downloads_handle:
+                driver.switch_to.window(current_handle)
+
+            self._downloads_handle = None
+
+
+class _DirectoryChanged:
+    # A watchdog event handler
+    def __init__(self, event):
+        self.event = event
+
+    def dispatch(self, event):
+        self.event.set()
+
+
+class LocalDownloadTracker(DownloadTracker):
+    # Watches the download directory of a local browser.  Uses filesystem
+    # events when watchdog is installed and polls the directory when not.
+    def __init__(self, download_directory, poll_frequency=0.1):
+        self.download_directory = Path(download_directory)
+        self.poll_frequency = poll_frequency
+        self._seen = set()
+
+    def get_completed_files(self):
+        names = {p.name for p in self.download_directory.iterdir() if p.is_file()}
+
+        return sorted(
+            self.download_directory / n
+            for n in names
+            if not n.endswith(PARTIAL_SUFFIXES)
+            and not any(f'{n}{s}' in names for s in PARTIAL_SUFFIXES)
+            and n not in self._seen
+        )
+
+    def wait(self, seconds_to_wait):
+        try:
+            from watchdog.observers import Observer
+        except ImportError:
+            Observer = None
+
+        changed = threading.Event()
+        observer = None
+
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(_DirectoryChanged(changed), str(self.download_directory))
+            observer.start()
+
+        try:
+            deadline = monotonic() + seconds_to_wait
+
+            while True:
+                changed.clear()
+                files = self.get_completed_files()
+
+                if files:
+                    self._seen.update(f.name for f in files)
+                    return [str(f) for f in files]
+
+                remaining = deadline - monotonic()
+
+                if remaining <= 0:
+                    raise TimeoutException(f'No download completed in {self.download_directory}')
+
+                if observer is None:
+                    changed.wait(min(remaining, self.poll_frequency))
+                else:
+                    changed.wait(remaining)
+
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def save(self, path, filename):
+        if Path(path).resolve() != Path(filename).resolve():
+            shutil.move(path, filename)
+            self._seen.discard(Path(path).name)
+            logging.debug(f'Moved {path} to {filename}')
+
+
+class ArchiveExtractor:
+    # Extracts zip archives on a pool of threads, which run in parallel as
+    # zlib releases the GIL.  Each archive is extracted into a directory
+    # of its own, named from the archive and its content, so archives with
+    # members of the same name are not written to the same path at once.
+    # Archives with the same content as one that has already been
+    # extracted are skipped.
+    def __init__(self, destination, workers=4):
+        self.destination = Path(destination)
+        self.workers = workers
+        self._extracted = set()
+        self._lock = threading.Lock()
+
+    def extract(self, archives):
+        return list(self.iter_extract(archives))
+
+    def iter_extract(self, archives):
+        # Yields the path of each member as soon as it has been written,
+        # in the order that they finish.
+        archives = list(archives)
+        results = queue.Queue()
+        cancelled = threading.Event()
+
+        if not archives:
+            return
+
+        with ThreadPoolExecutor(min(self.workers, len(archives))) as executor:
+            for a in archives:
+                executor.submit(self._extract, Path(a), results, cancelled)
+
+            try:
+                remaining = len(archives)
+
+                while remaining:
+                    result = results.get()
+
+                    if result is None:
+                        remaining -= 1
+                    elif isinstance(result, Exception):
+                        raise result
+                    else:
+                        yield result
+
+            finally:
+                cancelled.set()
+
+    def content_hash(self, archive):
+        h = hashlib.blake2b(digest_size=16)
+
+        with open(archive, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+    def _extract(self, archive, results, cancelled):
+        import zipfile
+
+        try:
+            content_hash = self.content_hash(archive)
+
+            with self._lock:
+                if content_hash in self._extracted:
+                    logging.info(f'Skipping {archive}, as its contents have already been extracted')
+                    return
+
+                self._extracted.add(content_hash)
+
+            completed = False
+            destination = self.destination / f'{archive.stem}-{content_hash[:12]}'
+
+            try:
+                with zipfile.ZipFile(archive, 'r') as zf:
+                    for member in zf.infolist():
+                        if cancelled.is_set():
+                            return
+
+                        # ZipFile.extract copies the member in chunks and
+                        # removes unsafe parts of its path
+                        path = Path(zf.extract(member, destination))
+
+                        if not member.is_dir():
+                            results.put(path)
+
+                completed = True
+                logging.info(f'Extracted {archive}')
+
+            finally:
+                if not completed:
+                    with self._lock:
+                        self._extracted.discard(content_hash)
+
+        except Exception as e:
+            results.put(e)
+
+        finally:
+            results.put(None)
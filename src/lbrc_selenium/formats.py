@@ -0,0 +1,158 @@
+import gzip
+import json
+import os
+import struct
+import zlib
+import jsonlines
+
+
+# The encoding that jsonlines writes each item with
+encode_line = json.JSONEncoder(ensure_ascii=False, separators=(', ', ': ')).encode
+
+COMPRESS_LEVEL = 6
+
+
+class JsonLinesWriter:
+    def __init__(self, fp):
+        self._fp = fp
+        self._writer = jsonlines.Writer(fp)
+
+    def tell(self):
+        return self._fp.tell()
+
+    def write(self, item):
+        return self._writer.write(item)
+
+    def close(self):
+        self._writer.close()
+        self._fp.close()
+
+
+class JsonLinesFormat:
+    # One JSON item on each line.  The only format that can be indexed,
+    # as its offsets can be read directly.
+    name = 'jsonl'
+    extension = 'jsonl'
+    indexed = True
+    has_lines = True
+
+    def open(self, filepath, mode='r'):
+        return open(filepath, mode + 'b')
+
+    def writer(self, filepath, mode='w'):
+        return JsonLinesWriter(self.open(filepath, mode))
+
+    def read(self, filepath):
+        with self.open(filepath) as f, jsonlines.Reader(f) as reader:
+            yield from reader
+
+    def read_lines(self, filepath):
+        with self.open(filepath) as f:
+            yield from f
+
+
+class GzipJsonLinesFormat(JsonLinesFormat):
+    name = 'jsonl.gz'
+    extension = 'jsonl.gz'
+    indexed = False
+
+    def open(self, filepath, mode='r'):
+        return gzip.open(filepath, mode + 'b', compresslevel=COMPRESS_LEVEL)
+
+
+class ColumnarWriter:
+    def __init__(self, fp, block_size):
+        self._fp = fp
+        self.block_size = block_size
+        self._keys = None
+        self._columns = []
+        self._count = 0
+
+        if self._fp.tell() == 0:
+            self._fp.write(ColumnarFormat.MAGIC)
+
+    def write(self, item):
+        keys = tuple(item)
+
+        if keys != self._keys or self._count >= self.block_size:
+            self._flush()
+            self._keys = keys
+            self._columns = [[] for _ in keys]
+
+        for column, value in zip(self._columns, item.values()):
+            column.append(value)
+
+        self._count += 1
+
+    def close(self):
+        self._flush()
+        self._fp.close()
+
+    def _flush(self):
+        if not self._count:
+            return
+
+        block = {'keys': list(self._keys), 'count': self._count, 'columns': self._columns}
+        data = zlib.compress(json.dumps(block, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), COMPRESS_LEVEL)
+
+        self._fp.write(struct.pack('<I', len(data)))
+        self._fp.write(data)
+        self._count = 0
+
+
+class ColumnarFormat:
+    # Blocks of up to block_size items with the same keys, such as the
+    # rows of a table, stored as one compressed list of values for each
+    # key.  Items with different keys start a new block, so suits
+    # tabular output best.
+    name = 'columnar'
+    extension = 'cols'
+    indexed = False
+    has_lines = False
+
+    MAGIC = b'LBRCCOL1'
+
+    def __init__(self, block_size=10_000):
+        self.block_size = block_size
+
+    def writer(self, filepath, mode='w'):
+        return ColumnarWriter(open(filepath, mode + 'b'), self.block_size)
+
+    def read(self, filepath):
+        with open(filepath, 'rb') as f:
+            magic = f.read(len(self.MAGIC))
+
+            if magic and magic != self.MAGIC:
+                raise ValueError(f'{filepath} is not a columnar items file')
+
+            while header := f.read(4):
+                (length,) = struct.unpack('<I', header)
+                block = json.loads(zlib.decompress(f.read(length)))
+                keys = block['keys']
+
+                if keys:
+                    for values in zip(*block['columns']):
+                        yield dict(zip(keys, values))
+                else:
+                    for _ in range(block['count']):
+                        yield {}
+
+
+FORMATS = {f.name: f for f in [JsonLinesFormat(), GzipJsonLinesFormat(), ColumnarFormat()]}
+
+
+def get_format(format=None):
+    if format is None:
+        format = os.environ.get("ITEMS_FORMAT", JsonLinesFormat.name)
+
+    if isinstance(format, str):
+        return FORMATS[format]
+
+    return format
+
+
+def format_for(filepath):
+    # The format of a file, from its extension
+    for f in sorted(FORMATS.values(), key=lambda f: -len(f.extension)):
+        if str(filepath).endswith(f'.{f.extension}'):
+            return f
@@ -0,0 +1,164 @@
+import contextlib
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+import selenium
+
+
+SELENIUM_DIRECTORY = os.path.dirname(selenium.__file__)
+CALLER_DEPTH = 2
+
+_recorder_numbers = itertools.count()
+
+
+@dataclass
+class CommandStatistics:
+    count: int = 0
+    total: float = 0
+    longest: float = 0
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.longest = max(self.longest, duration)
+
+
+class CommandRecorder:
+    # Records every command that a driver sends, with how long it took
+    # and the methods outside Selenium that sent it.  Statistics are kept
+    # in memory and, if a directory is given, each command is also
+    # written to a trace file in Chrome's trace event format, which can be
+    # opened with https://ui.perfetto.dev.
+    def __init__(self, directory=None, name=None):
+        self.name = name or f'{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{next(_recorder_numbers)}'
+        self.directory = Path(directory) if directory else None
+        self.commands = {}
+        self.callers = {}
+        self.spans = {}
+        self._lock = threading.Lock()
+        self._start = perf_counter()
+        self._trace = None
+        self._traced = 0
+        self._count = 0
+
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._trace = open(self.trace_filepath(), 'w', encoding='utf-8')
+            self._trace.write('[')
+
+    def trace_filepath(self):
+        return self.directory / f'{self.name}.trace.json'
+
+    def summary_filepath(self):
+        return self.directory / f'{self.name}.summary.json'
+
+    def install(self, driver):
+        # WebElement commands also go through their driver's execute
+        execute = driver.execute
+
+        def instrumented_execute(driver_command, params=None):
+            start = perf_counter()
+
+            try:
+                return execute(driver_command, params)
+            finally:
+                self.record(driver_command, start, perf_counter() - start, self.caller())
+
+        driver.execute = instrumented_execute
+
+    def caller(self):
+        frame = sys._getframe(2)
+        names = []
+
+        while frame is not None and len(names) < CALLER_DEPTH:
+            filename = frame.f_code.co_filename
+
+            if not filename.startswith(SELENIUM_DIRECTORY) and filename != __file__:
+                names.append(frame.f_code.co_qualname)
+
+            frame = frame.f_back
+
+        return ' < '.join(names)
+
+    def record(self, command, start, duration, caller):
+        with self._lock:
+            self._count += 1
+            self.commands.setdefault(command, CommandStatistics()).record(duration)
+            self.callers.setdefault(caller, CommandStatistics()).record(duration)
+            self._write_event(command, 'command', start, duration, {'caller': caller})
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        # Times a block, such as scraping one page, and counts the
+        # commands sent while it runs
+        before = self.count()
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            duration = perf_counter() - start
+
+            with self._lock:
+                self.spans.setdefault(name, CommandStatistics()).record(duration)
+                self._write_event(name, 'span', start, duration, {'commands': self.count() - before, **args})
+
+    def count(self):
+        return self._count
+
+    def summary(self):
+        def by_total(statistics):
+            return {k: asdict(v) for k, v in sorted(statistics.items(), key=lambda s: -s[1].total)}
+
+        with self._lock:
+            return {
+                'name': self.name,
+                'count': self.count(),
+                'total': sum(s.total for s in self.commands.values()),
+                'commands': by_total(self.commands),
+                'callers': by_total(self.callers),
+                'spans': by_total(self.spans),
+            }
+
+    def close(self):
+        summary = self.summary()
+
+        logging.info(f'{summary["count"]} WebDriver commands took {summary["total"]:.3f}s')
+
+        for caller, s in itertools.islice(summary['callers'].items(), 5):
+            logging.info(f'  {s["count"]} commands, {s["total"]:.3f}s: {caller}')
+
+        if self._trace is not None:
+            self._trace.write('\n]\n')
+            self._trace.close()
+            self._trace = None
+
+            with open(self.summary_filepath(), 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+
+        return summary
+
+    def _write_event(self, name, category, start, duration, args):
+        if self._trace is None:
+            return
+
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self._start) * 1_000_000),
+            'dur': round(duration * 1_000_000),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+
+        self._trace.write((',\n' if self._traced else '\n') + json.dumps(event))
+        self._traced += 1
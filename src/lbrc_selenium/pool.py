@@ -0,0 +1,187 @@
+import contextlib
+import json
+import logging
+import os
+import queue
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from selenium.common.exceptions import WebDriverException
+from lbrc_selenium import ItemFileGroup
+from lbrc_selenium.selenium import get_selenium
+
+
+@dataclass
+class CrawlItem:
+    url: str
+    scrape: typing.Callable
+    template_arguments: dict = None
+
+    def checkpoint_key(self):
+        return json.dumps([self.url, self.template_arguments], sort_keys=True, default=str)
+
+
+class SeleniumHelperPool:
+    def __init__(self, size, factory=None, max_recycles=2):
+        self.size = size
+        self.factory = factory
+        self.max_recycles = max_recycles
+        self.recycled = 0
+        self.helpers = []
+        self._available = queue.Queue()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        with ThreadPoolExecutor(self.size) as executor:
+            futures = [executor.submit(self._new_helper, slot) for slot in range(len(self.helpers), self.size)]
+
+        for f in futures:
+            if f.exception() is None:
+                self._add(f.result())
+
+        for f in futures:
+            if f.exception() is not None:
+                self.close()
+                raise f.exception()
+
+        return self
+
+    def close(self):
+        for h in self.helpers:
+            self._close_helper(h)
+
+        self.helpers = []
+        self._available = queue.Queue()
+
+    def crawl(self, crawl_items):
+        return list(self.iter_crawl(crawl_items))
+
+    def iter_crawl(self, crawl_items):
+        # Yields the results in the order of the crawl items, each as soon
+        # as it and those before it are done
+        if not self.helpers:
+            self.start()
+
+        executor = ThreadPoolExecutor(self.size)
+
+        try:
+            yield from executor.map(self._scrape, crawl_items)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def crawl_into(self, target, crawl_items):
+        # Results are added in the order of the crawl items, rather than the
+        # order in which they finish, so that the output does not depend on
+        # which session was quickest.  Files with a journal checkpoint
+        # each crawl item once its items are added, and the crawl items
+        # that an earlier run completed are skipped.
+        files = {}
+
+        def file_for(crawl_item):
+            if not isinstance(target, ItemFileGroup):
+                return files.setdefault(None, target)
+
+            filename = target.get_filename(crawl_item.template_arguments)
+
+            if filename not in files:
+                files[filename] = target.get_file(crawl_item.template_arguments)
+
+            return files[filename]
+
+        crawl_items = [c for c in crawl_items if not file_for(c).is_complete(c.checkpoint_key())]
+
+        if any(f.completed for f in files.values()):
+            logging.info(f'Resuming crawl with {len(crawl_items)} items left')
+
+        for crawl_item, result in zip(crawl_items, self.iter_crawl(crawl_items)):
+            items_file = file_for(crawl_item)
+
+            for item in self._as_items(result):
+                items_file.add_item(item)
+
+            items_file.checkpoint(crawl_item.checkpoint_key())
+
+        for items_file in files.values():
+            items_file.save()
+
+        return list(files.values())
+
+    def is_alive(self, helper):
+        try:
+            helper.driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    def _scrape(self, crawl_item):
+        helper = self._available.get()
+        recycles = 0
+
+        try:
+            while True:
+                try:
+                    with self._span(helper, crawl_item):
+                        if crawl_item.url is not None:
+                            helper.get(crawl_item.url)
+
+                        return crawl_item.scrape(helper)
+
+                except Exception as e:
+                    if recycles >= self.max_recycles or self.is_alive(helper):
+                        raise e
+
+                    logging.warning(f'Recycling crashed session after {type(e).__name__} on {crawl_item.url}')
+
+                    helper = self._recycle(helper)
+                    recycles += 1
+        finally:
+            self._available.put(helper)
+
+    def _span(self, helper, crawl_item):
+        if helper.command_recorder is None:
+            return contextlib.nullcontext()
+
+        return helper.command_recorder.span(getattr(crawl_item.scrape, '__qualname__', 'scrape'), url=crawl_item.url)
+
+    def _new_helper(self, slot):
+        if self.factory is not None:
+            return self.factory()
+
+        # Each session has a download directory of its own, as a helper
+        # clears its download directory when created, so starting or
+        # recycling one session would remove the downloads of the others
+        return get_selenium(download_directory=Path(os.environ["DOWNLOAD_DIRECTORY"]) / f'session_{slot}')
+
+    def _recycle(self, helper):
+        self._close_helper(helper)
+
+        slot = self.helpers.index(helper)
+        new_helper = self._new_helper(slot)
+        self.helpers[slot] = new_helper
+        self.recycled += 1
+
+        return new_helper
+
+    def _add(self, helper):
+        self.helpers.append(helper)
+        self._available.put(helper)
+
+    def _close_helper(self, helper):
+        try:
+            helper.close()
+        except Exception as e:
+            logging.warning(f'Failed to close session: {e}')
+
+    def _as_items(self, result):
+        if result is None:
+            return []
+        elif isinstance(result, list):
+            return result
+        else:
+            return [result]
@@ -1,34 +1,248 @@
+from bisect import bisect_right
 from collections import OrderedDict
 import dataclasses
+import functools
 from itertools import islice
 import os
-import zipfile
+import random
 import re
-import smtplib
+import shutil
 import typing
-from time import sleep
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
+import zlib
+from time import monotonic, sleep
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import NoAlertPresentException, NoSuchElementException, StaleElementReferenceException, TimeoutException
 from urllib.parse import urljoin
-from pathlib import Path
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.encoders import encode_base64
-from email.mime.text import MIMEText
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import UnexpectedAlertPresentException
-from packaging import version
+from pathlib import Path, PurePosixPath, PureWindowsPath
+from selenium.common.exceptions import UnexpectedAlertPresentException, InvalidSelectorException, WebDriverException
 from dataclasses import dataclass
 import logging
 import base64
 import tempfile
+import threading
+from lbrc_selenium.atomic import atomic_write
+from lbrc_selenium.downloads import DOWNLOADS_SCRIPT, ArchiveExtractor, GridDownloadTracker, LocalDownloadTracker
+from lbrc_selenium.cache import ScrapeCache, cache_key
+from lbrc_selenium.session import SessionState, origin
 
 
 RE_REMOVE_HTML_TAGS = re.compile('<.*?>')
 
 
+@functools.lru_cache(maxsize=None)
+def parse_version(ver):
+    from packaging import version
+
+    return version.parse(ver)
+
+
+@functools.lru_cache(maxsize=1024)
+def latest_version_key(keys, ver):
+    # The key of the latest version that is not after ver
+    cv = parse_version(ver)
+    return max([k for k in keys if parse_version(k) <= cv], key=parse_version)
+
+
+# Scripts
+
+# Functions shared by the scripts that scrape in the browser.  textOf returns
+# the same candidates that SeleniumHelper.get_text tries, in order, and stops
+# at the first that is not blank, so that SeleniumHelper.resolve_text can
+# normalise them in Python.
+SCRIPT_FUNCTIONS = '''
+function find(context, selector) {
+    if (selector.by === 'xpath') {
+        var snapshot = document.evaluate(selector.query, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        var result = [];
+
+        for (var i = 0; i < snapshot.snapshotLength; i++) {
+            if (snapshot.snapshotItem(i).nodeType === Node.ELEMENT_NODE) {
+                result.push(snapshot.snapshotItem(i));
+            }
+        }
+        return result;
+    }
+    return Array.prototype.slice.call(context.querySelectorAll(selector.query));
+}
+
+function tagName(element) {
+    return element.tagName.toLowerCase();
+}
+
+function property(element, name) {
+    var value = element[name];
+    return (value === undefined || value === null || typeof value === 'object') ? element.getAttribute(name) : String(value);
+}
+
+function isBlank(value) {
+    return (value || '').replace(/<[^\\n]*?>/g, '').trim() === '';
+}
+
+function textOf(element) {
+    var result = [element.getClientRects().length ? element.innerText : ''];
+
+    if (isBlank(result[0])) {
+        result.push(property(element, 'text'));
+
+        if (isBlank(result[1])) {
+            result.push(element.innerHTML);
+        }
+    }
+    return result;
+}
+
+function contentsOf(element) {
+    var result = {tag: tagName(element), text: textOf(element)};
+
+    if (result.tag === 'a') {
+        result.href = property(element, 'href');
+    }
+    return result;
+}
+
+function unnested(elements) {
+    var candidates = new Set(elements), nested = new Set();
+
+    elements.forEach(function (e) {
+        for (var p = e.parentElement; p; p = p.parentElement) {
+            if (candidates.has(p)) {
+                nested.add(e);
+                nested.add(p);
+            }
+        }
+    });
+    return elements.filter(function (e) { return !nested.has(e); });
+}
+
+function sortedByTagName(elements) {
+    var keyed = elements.map(function (e, i) { return [tagName(e), i, e]; });
+
+    keyed.sort(function (a, b) { return a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : a[1] - b[1]; });
+
+    return keyed.map(function (k) { return k[2]; });
+}
+
+function valueOf(element, selector) {
+    var value = unnested(sortedByTagName(find(element, selector)))[0];
+
+    return {resolved: !!value, contents: contentsOf(value || element)};
+}
+'''
+
+UNNESTED_ELEMENTS_SCRIPT = SCRIPT_FUNCTIONS + '''
+return unnested(arguments[1] ? sortedByTagName(arguments[0]) : arguments[0]);
+'''
+
+TEXT_SCRIPT = SCRIPT_FUNCTIONS + '''
+return arguments[0].map(textOf);
+'''
+
+ELEMENT_COUNT_SCRIPT = SCRIPT_FUNCTIONS + '''
+return find(document, arguments[0]).length;
+'''
+
+FILE_INPUT_SCRIPT = '''
+var input = window.document.createElement('INPUT');
+input.setAttribute('type', 'file');
+input.hidden = true;
+input.onchange = function (e) { e.stopPropagation() };
+return window.document.documentElement.appendChild(input);
+'''
+
+FILE_SIZE_SCRIPT = '''
+return arguments[0].files[0].size;
+'''
+
+# Reads part of the file selected in a file input, and returns it base64
+# encoded with its CRC-32, so that each chunk can be checked on arrival.
+FILE_CHUNK_SCRIPT = '''
+var input = arguments[0], start = arguments[1], end = arguments[2], callback = arguments[3];
+var table = window.__lbrcCrcTable;
+
+if (!table) {
+    table = window.__lbrcCrcTable = new Int32Array(256);
+
+    for (var n = 0; n < 256; n++) {
+        var c = n;
+        for (var k = 0; k < 8; k++) {
+            c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+        }
+        table[n] = c;
+    }
+}
+
+var reader = new FileReader();
+
+reader.onload = function () {
+    var bytes = new Uint8Array(reader.result), crc = -1, binary = '';
+
+    for (var i = 0; i < bytes.length; i++) {
+        crc = table[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+    }
+    for (var i = 0; i < bytes.length; i += 0x8000) {
+        binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+    }
+    callback({data: btoa(binary), crc: (crc ^ -1) >>> 0});
+};
+reader.onerror = function () { callback({error: String(reader.error)}); };
+reader.readAsArrayBuffer(input.files[0].slice(start, end));
+'''
+
+DOCUMENT_READY_SCRIPT = '''
+return document.readyState === 'complete' && !!document.body;
+'''
+
+# Records the time of the last change to the DOM, so that a wait can end
+# once the page has stopped changing.  The observer is lost when the page
+# is unloaded, and is then installed again on the next call.
+DOM_SETTLED_SCRIPT = '''
+var quietTime = arguments[0], reset = arguments[1], state = window.__lbrcMutations;
+
+if (!state) {
+    state = window.__lbrcMutations = {last: Date.now()};
+    new MutationObserver(function () { state.last = Date.now(); })
+        .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    return false;
+}
+if (reset) {
+    state.last = Date.now();
+    return false;
+}
+return document.readyState === 'complete' && Date.now() - state.last >= quietTime;
+'''
+
+TABLE_EXTRACT_SCRIPT = SCRIPT_FUNCTIONS + '''
+var parent = arguments[0], selectors = arguments[1];
+
+return {
+    headers: find(parent, selectors.header).map(textOf),
+    rows: find(parent, selectors.row).map(function (row) {
+        return find(row, selectors.cell).map(function (cell) { return valueOf(cell, selectors.value); });
+    }),
+};
+'''
+
+
+def unnested_elements(elements, parent_of):
+    # Elements which neither contain, nor are contained by, another of the
+    # elements.  The same as the unnested script function, for elements that
+    # are not in a browser.
+    candidates = set(elements)
+    nested = set()
+
+    for e in elements:
+        p = parent_of(e)
+
+        while p is not None:
+            if p in candidates:
+                nested.add(e)
+                nested.add(p)
+
+            p = parent_of(p)
+
+    return [e for e in elements if e not in nested]
+
+
 # Selectors
 
 class Selector:
@@ -36,6 +250,19 @@ class Selector:
         self.query = query
         self.by = by
 
+    def script_argument(self):
+        # The same conversion WebDriver makes before finding elements
+        if self.by == By.XPATH:
+            return {'by': 'xpath', 'query': self.query}
+        elif self.by == By.ID:
+            return {'by': 'css', 'query': f'[id="{self.query}"]'}
+        elif self.by == By.NAME:
+            return {'by': 'css', 'query': f'[name="{self.query}"]'}
+        elif self.by == By.CLASS_NAME:
+            return {'by': 'css', 'query': f'.{self.query}'}
+        else:
+            return {'by': 'css', 'query': self.query}
+
 class CssSelector(Selector):
     def __init__(self, query):
         super().__init__(query, By.CSS_SELECTOR)
@@ -62,49 +289,202 @@ class IdSelector(Selector):
 
     
 
+# Conditions
 
-# Actions
+class WaitCondition:
+    def arm(self, helper, element=None):
+        pass
 
-class Action:
-    def __init__(self, helper, selector):
-        self.helper = helper
+    def is_met(self, helper):
+        raise NotImplementedError()
+
+
+class DocumentReady(WaitCondition):
+    def is_met(self, helper):
+        return helper.driver.execute_script(DOCUMENT_READY_SCRIPT)
+
+
+class SelectorPresent(WaitCondition):
+    def __init__(self, selector):
         self.selector = selector
 
-    def do(self):
+    def is_met(self, helper):
+        return helper.driver.execute_script(ELEMENT_COUNT_SCRIPT, self.selector.script_argument()) > 0
+
+
+class SelectorAbsent(SelectorPresent):
+    def is_met(self, helper):
+        return not super().is_met(helper)
+
+
+class DomSettled(WaitCondition):
+    def __init__(self, quiet_time=0.3):
+        self.quiet_time = quiet_time
+
+    def arm(self, helper, element=None):
+        helper.driver.execute_script(DOM_SETTLED_SCRIPT, self.quiet_time * 1000, True)
+
+    def is_met(self, helper):
+        return helper.driver.execute_script(DOM_SETTLED_SCRIPT, self.quiet_time * 1000, False)
+
+
+class ElementStale(WaitCondition):
+    def __init__(self):
+        self.element = None
+
+    def arm(self, helper, element=None):
+        self.element = element
+
+    def is_met(self, helper):
+        if self.element is None:
+            return False
+
+        try:
+            self.element.is_enabled()
+            return False
+        except StaleElementReferenceException:
+            return True
+
+
+class UrlChanged(WaitCondition):
+    def __init__(self):
+        self.url = None
+
+    def arm(self, helper, element=None):
+        self.url = helper.driver.current_url
+
+    def is_met(self, helper):
+        return helper.driver.current_url != self.url
+
+
+class AnyOf(WaitCondition):
+    def __init__(self, *conditions):
+        self.conditions = conditions
+
+    def arm(self, helper, element=None):
+        for c in self.conditions:
+            c.arm(helper, element)
+
+    def is_met(self, helper):
+        return any(c.is_met(helper) for c in self.conditions)
+
+
+@dataclass
+class WaitStatistics:
+    count: int = 0
+    total: float = 0
+    longest: float = 0
+    last: float = 0
+    saved: float = 0
+
+    def record(self, waited, limit=None):
+        self.count += 1
+        self.total += waited
+        self.longest = max(self.longest, waited)
+        self.last = waited
+
+        if limit is not None:
+            self.saved += max(0, limit - waited)
+
+
+# Retries
+
+@dataclass
+class RetryMetrics:
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    failures: int = 0
+    waited: float = 0
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        attempts=4,
+        delay=0.25,
+        backoff=2,
+        max_delay=5,
+        jitter=0.5,
+        deadline=None,
+        retry_on=(WebDriverException,),
+        fail_fast_on=(InvalidSelectorException, NoSuchElementException),
+    ):
+        self.attempts = attempts
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_on = retry_on
+        self.fail_fast_on = fail_fast_on
+        self.metrics = RetryMetrics()
+
+    def should_retry(self, exception):
+        return isinstance(exception, self.retry_on) and not isinstance(exception, self.fail_fast_on)
+
+    def get_delay(self, retried):
+        delay = min(self.max_delay, self.delay * (self.backoff ** retried))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def call(self, func, *args, **kwargs):
+        self.metrics.calls += 1
+        start = monotonic()
         retried = 0
 
         while True:
-            try:
-                self._do()
+            self.metrics.attempts += 1
 
-                return
+            try:
+                return func(*args, **kwargs)
 
             except Exception as e:
-                if retried > 2:
+                delay = self.get_delay(retried)
+
+                out_of_attempts = retried + 1 >= self.attempts
+                out_of_time = self.deadline is not None and monotonic() - start + delay > self.deadline
+
+                if out_of_attempts or out_of_time or not self.should_retry(e):
+                    self.metrics.failures += 1
                     raise e
 
-                sleep(1)
+                logging.warning(f'Retrying after {type(e).__name__} in {delay:.2f}s')
+
+                sleep(delay)
+                self.metrics.retries += 1
+                self.metrics.waited += delay
                 retried += 1
 
-                print('Retrying...')
+
+# Actions
+
+class Action:
+    def __init__(self, helper, selector, retry_policy=None):
+        self.helper = helper
+        self.selector = selector
+        self.retry_policy = retry_policy
+
+    def do(self):
+        (self.retry_policy or self.helper.retry_policy).call(self._do)
 
     def _do(self):
         raise NotImplementedError()
 
 
 class SelectAction(Action):
-    def __init__(self, helper, select_selector, item_selector):
-        super().__init__(helper, select_selector)
+    def __init__(self, helper, select_selector, item_selector, wait_for=None, retry_policy=None):
+        super().__init__(helper, select_selector, retry_policy)
         self.item_selector = item_selector
+        self.wait_for = wait_for
 
     def _do(self):
-        self.helper.click_element(selector=self.selector)
-        self.helper.click_element(selector=self.item_selector)
+        self.helper.click_element(selector=self.selector, wait_for=self.wait_for)
+        self.helper.click_element(selector=self.item_selector, wait_for=self.wait_for)
 
 
 class TypeInTextboxAction(Action):
-    def __init__(self, helper, selector, text):
-        super().__init__(helper, selector)
+    def __init__(self, helper, selector, text, retry_policy=None):
+        super().__init__(helper, selector, retry_policy)
         self.text = text
 
     def _do(self):
@@ -115,16 +495,17 @@ class TypeInTextboxAction(Action):
 
 
 class ClickAction(Action):
-    def __init__(self, helper, selector):
-        super().__init__(helper, selector)
+    def __init__(self, helper, selector, wait_for=None, retry_policy=None):
+        super().__init__(helper, selector, retry_policy)
+        self.wait_for = wait_for
 
     def _do(self):
-        self.helper.click_element(selector=self.selector)
+        self.helper.click_element(selector=self.selector, wait_for=self.wait_for)
 
 
 class EnsureAction(Action):
-    def __init__(self, helper, selector):
-        super().__init__(helper, selector)
+    def __init__(self, helper, selector, retry_policy=None):
+        super().__init__(helper, selector, retry_policy)
 
     def _do(self):
         self.helper.get_element_selector(selector=self.selector)
@@ -144,110 +525,265 @@ class SeleniumHelper:
         email_address=None,
         version='0.0.0',
         compare_version='0.0.0',
+        page_ready=None,
+        poll_frequency=0.1,
+        click_wait_for=None,
+        retry_policy=None,
+        download_chunk_size=4 * 1024 * 1024,
+        download_tracker=None,
+        unzip_workers=4,
+        session_state_filepath=None,
+        session_state_max_age=None,
+        command_recorder=None,
+        scrape_cache_size=None,
     ):
         self.click_wait_time = click_wait_time
         self.download_wait_time = download_wait_time
+        self.download_chunk_size = download_chunk_size
         self.page_wait_time = page_wait_time
+        self.page_ready = page_ready or DocumentReady()
+        self.poll_frequency = poll_frequency
+        self.navigation_waits = WaitStatistics()
+        self.click_wait_for = click_wait_for
+        self.click_waits = WaitStatistics()
+        self.retry_policy = retry_policy or RetryPolicy()
         self.version = version
 
         self.driver = driver
 
+        self.command_recorder = command_recorder
+
+        if command_recorder is not None:
+            if isinstance(driver, BackgroundDriver):
+                driver.add_start_hook(command_recorder.install)
+            else:
+                command_recorder.install(driver)
+
         self.base_url = base_url
         self.quitter = quitter
 
         self.email_address = email_address
 
+        self.session_state_filepath = session_state_filepath
+        self.session_state_max_age = session_state_max_age
+
         self.compare_version = compare_version
 
         self.download_directory = Path(download_directory)
         self.download_directory.mkdir(parents=True, exist_ok=True)
         self._clear_directory(self.download_directory)
+        self.download_tracker = download_tracker or GridDownloadTracker(self)
+        # Kept out of the download directory itself, so that extracted
+        # files are not taken for downloads
+        self.extract_directory = self.download_directory / 'extracted'
+        self.archive_extractor = ArchiveExtractor(self.extract_directory, workers=unzip_workers)
 
         self.global_output_directory = Path(output_directory)
         self.output_directory = Path(output_directory) / self.version
         self.output_directory.mkdir(parents=True, exist_ok=True)
 
-    def download_file(self, filename):
-        # list all the completed remote files (waits for at least one)
-        files = WebDriverWait(self.driver, 30, 1).until(lambda driver: self.get_downloaded_files(driver))
+        # Shared by every version, so that a page scraped for one version
+        # is not scraped again for the next
+        if scrape_cache_size:
+            self.scrape_cache = ScrapeCache(self.global_output_directory / '.scrape_cache', scrape_cache_size)
+        else:
+            self.scrape_cache = None
+
+    def download_file(self, filename=None):
+        # The first file is saved as filename, if one is given, and the
+        # others beside it with their own names
+        if filename:
+            directory = Path(filename).parent
+        else:
+            directory = self.download_directory
+
+        result = []
+
+        try:
+            # wait for the downloads that have completed since the last call
+            files = self.download_tracker.wait(self.download_wait_time)
+
+            for i, path in enumerate(files):
+                if filename and i == 0:
+                    target = Path(filename)
+                else:
+                    target = directory / self._remote_filename(path)
 
-        # get the content of the first file remotely
-        content = self.get_file_content(self.driver, files[0])
+                self.download_tracker.save(path, target)
+                result.append(target)
 
-        with open(filename, 'wb') as f:
-            f.write(content)
+                logging.info(f"Downloaded {path} to {target}")
+
+        finally:
+            self.download_tracker.finish()
 
-        logging.info("Test test_grid_download_files executed successfully")
+        return result
 
     def get_downloaded_files(self, driver):
         if not driver.current_url.startswith("chrome://downloads"):
             driver.get("chrome://downloads/")
 
-        return driver.execute_script( \
-            "return  document.querySelector('downloads-manager')  "
-            " .shadowRoot.querySelector('#downloadsList')         "
-            " .items.filter(e => e.state === 'COMPLETE')          "
-            " .map(e => e.filePath || e.file_path || e.fileUrl || e.file_url); ")
+        return driver.execute_script(DOWNLOADS_SCRIPT)
 
     def get_file_content(self, driver, path):
-        try:
-            elem = driver.execute_script( \
-                "var input = window.document.createElement('INPUT'); "
-                "input.setAttribute('type', 'file'); "
-                "input.hidden = true; "
-                "input.onchange = function (e) { e.stopPropagation() }; "
-                "return window.document.documentElement.appendChild(input); " )
+        return b''.join(self.iter_file_content(driver, path))
+
+    def save_file_content(self, driver, path, filename):
+        with atomic_write(filename) as partial_filename, open(partial_filename, 'wb') as f:
+            for chunk in self.iter_file_content(driver, path):
+                f.write(chunk)
+
+    def iter_file_content(self, driver, path):
+        elem = driver.execute_script(FILE_INPUT_SCRIPT)
 
+        try:
             elem._execute('sendKeysToElement', {'value': [ path ], 'text': path})
 
-            result = driver.execute_async_script( \
-                "var input = arguments[0], callback = arguments[1]; "
-                "var reader = new FileReader(); "
-                "reader.onload = function (ev) { callback(reader.result) }; "
-                "reader.onerror = function (ex) { callback(ex.message) }; "
-                "reader.readAsDataURL(input.files[0]); "
-                "input.remove(); "
-                , elem)
+            size = driver.execute_script(FILE_SIZE_SCRIPT, elem)
+            received = 0
+
+            while received < size:
+                end = min(size, received + self.download_chunk_size)
+                result = driver.execute_async_script(FILE_CHUNK_SCRIPT, elem, received, end)
+
+                if 'error' in result:
+                    raise Exception("Failed to get file content: %s" % result['error'])
+
+                chunk = base64.b64decode(result['data'])
 
-            if not result.startswith('data:') :
-                raise Exception("Failed to get file content: %s" % result)
+                if len(chunk) != end - received or zlib.crc32(chunk) != result['crc']:
+                    raise Exception(f"Failed to get file content: chunk at {received} of {path} is corrupt")
 
-            return base64.b64decode(result[result.find('base64,') + 7:])
+                received = end
+
+                yield chunk
 
         finally:
-            logging.info("get_file_content executed successfully")
+            driver.execute_script("arguments[0].remove();", elem)
 
+    def _remote_filename(self, path):
+        if '\\' in path:
+            return PureWindowsPath(path).name
+        else:
+            return PurePosixPath(path).name
 
     def unzip_download_directory_contents(self):
-        for zp in self._download_directory.iterdir():
-            with zipfile.ZipFile(zp, "r") as zf:
-                zf.extractall(self._download_directory)
-    
+        return list(self.iter_unzip_download_directory_contents())
+
+    def iter_unzip_download_directory_contents(self):
+        import zipfile
+
+        archives = [p for p in sorted(self.download_directory.iterdir()) if p.is_file() and zipfile.is_zipfile(p)]
+
+        yield from self.archive_extractor.iter_extract(archives)
+
     def _clear_directory(self, directory):
+        # Files may be removed by another helper clearing the same
+        # directory
         for f in directory.iterdir():
-            f.unlink()
+            if f.is_dir() and not f.is_symlink():
+                shutil.rmtree(f, ignore_errors=True)
+            else:
+                f.unlink(missing_ok=True)
     
     def get_compare_version_item(self, versions):
-        cv = version.parse(self.compare_version)
-        latest_version = max([k for k in versions.keys() if version.parse(k) <= cv])
-        return versions[latest_version]
+        return versions[latest_version_key(tuple(versions.keys()), self.compare_version)]
         
     def get_version_item(self, versions):
-        cv = version.parse(self.version)
-        latest_version = max(map(version.parse, [k for k in versions.keys() if version.parse(k) <= cv]))
-        return versions[str(latest_version)]
+        return versions[latest_version_key(tuple(versions.keys()), self.version)]
         
-    def get(self, url):
+    def get(self, url, ready=None):
+        ready = ready or self.page_ready
         base = self.base_url
 
+        ready.arm(self)
         self.driver.get(urljoin(base, url))
 
-        for i in range(20):
-            try:
-                self.get_element(CssSelector('body'), allow_null=False)
-            except UnexpectedAlertPresentException as e:
-                # self.driver.switch_to.alert.accept();
-                sleep(1)
+        start = monotonic()
+
+        try:
+            self.wait_until(ready, self.page_wait_time)
+        except TimeoutException as e:
+            if not self.is_alert_present():
+                raise e
+
+            logging.warning(f'Alert still present after loading {url}')
+
+        waited = monotonic() - start
+        self.navigation_waits.record(waited)
+        logging.debug(f'Waited {waited:.3f}s for {url} to be ready')
+
+        return waited
+
+    def wait_until(self, condition, seconds_to_wait):
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        return WebDriverWait(
+            self.driver,
+            seconds_to_wait,
+            poll_frequency=self.poll_frequency,
+            ignored_exceptions=(UnexpectedAlertPresentException,),
+        ).until(lambda driver: condition.is_met(self))
+
+    def is_alert_present(self):
+        try:
+            self.driver.switch_to.alert
+            return True
+        except NoAlertPresentException:
+            return False
+
+    def ensure_logged_in(self, login, is_logged_in):
+        # Restores the state saved after the last login, if is_logged_in
+        # (helper) then shows it is still valid, and otherwise calls
+        # login(helper) and saves the new state.  Login cookies rarely
+        # have an expiry, so only the site can tell that the state has
+        # expired.  Returns True if login was called.
+        if self.restore_session_state(is_logged_in):
+            logging.info('Restored saved session state')
+            return False
+
+        login(self)
+        self.save_session_state()
+
+        return True
+
+    def save_session_state(self):
+        if self.session_state_filepath is None:
+            return
+
+        # Cookies and storage can only be read for the current page, so
+        # return to base_url if the login ended on another site
+        url = self.base_url or self.driver.current_url
+
+        if origin(self.driver.current_url) != origin(url):
+            self.get(url)
+
+        SessionState.from_driver(self.driver, url).save(self.session_state_filepath)
+
+    def restore_session_state(self, is_logged_in):
+        if self.session_state_filepath is None:
+            return False
+
+        state = SessionState.load(self.session_state_filepath)
+
+        if state is None or state.is_expired(self.session_state_max_age):
+            return False
+
+        try:
+            state.apply(self.driver)
+
+            # The page was loaded before the state was restored, so is
+            # loaded again to show it logged in
+            self.get(self.base_url or state.url)
+
+            return bool(is_logged_in(self))
+
+        except WebDriverException as e:
+            logging.warning(f'Failed to restore session state: {e}')
+            return False
+
+    def retry(self, func, *args, retry_policy=None, **kwargs):
+        return (retry_policy or self.retry_policy).call(func, *args, **kwargs)
 
     def convert_to_relative_url(self, url):
         if url.startswith(self.base_url):
@@ -256,9 +792,13 @@ class SeleniumHelper:
             return url
 
     def wait_to_appear(self, selector, element=None, seconds_to_wait=10):
+        from selenium.webdriver.support.ui import WebDriverWait
+
         return WebDriverWait((element or self.driver), seconds_to_wait).until(lambda x: x.find_element(selector.by, selector.query))
     
     def wait_to_disappear(self, selector, element=None, seconds_to_wait=10):
+        from selenium.webdriver.support.ui import WebDriverWait
+
         return WebDriverWait((element or self.driver), seconds_to_wait).until_not(lambda x: x.find_element(selector.by, selector.query))
     
     def get_parent(self, element):
@@ -274,6 +814,25 @@ class SeleniumHelper:
     
     def get_elements(self, selector, element=None):
         return (element or self.driver).find_elements(selector.by, selector.query)
+
+    def get_unnested_elements(self, elements, sort_by_tag_name=False):
+        from selenium.webdriver.remote.webelement import WebElement
+
+        if len(elements) < 2:
+            return list(elements)
+
+        if not isinstance(elements[0], WebElement):
+            if sort_by_tag_name:
+                elements = sorted(elements, key=lambda x: x.tag_name)
+
+            return unnested_elements(elements, lambda x: x.parent_element)
+
+        return self.driver.execute_script(UNNESTED_ELEMENTS_SCRIPT, elements, sort_by_tag_name)
+
+    def get_snapshot(self):
+        from lbrc_selenium.snapshot import DomSnapshot
+
+        return DomSnapshot.from_driver(self.driver)
     
     def type_in_textbox(self, selector, text, element=None):
         e = self.get_element(selector, element=element)
@@ -281,26 +840,51 @@ class SeleniumHelper:
         e.send_keys(text)
         return e
 
-    def click_element(self, selector, element=None):
+    def click_element(self, selector, element=None, wait_for=None):
         e = self.get_element(selector, element=element)
-        e.click()
-        sleep(self.click_wait_time)
+        self.click(e, wait_for=wait_for)
         return e
     
-    def click_all(self, selector, element=None):
+    def click_all(self, selector, element=None, wait_for=None):
         while True:
             element = self.get_element(selector, allow_null=True, element=element)
 
             if element is None:
                 break
             
+            self.click(element, wait_for=wait_for)
+
+    def click(self, element, wait_for=None):
+        # Waits until the click has had an effect, but never for longer
+        # than click_wait_time.  Without a condition, always waits for
+        # click_wait_time.
+        wait_for = wait_for or self.click_wait_for
+
+        if wait_for is None:
             element.click()
             sleep(self.click_wait_time)
+            self.click_waits.record(self.click_wait_time, self.click_wait_time)
+            return
+
+        wait_for.arm(self, element)
+        element.click()
+
+        start = monotonic()
+
+        try:
+            self.wait_until(wait_for, self.click_wait_time)
+        except TimeoutException:
+            pass
+
+        self.click_waits.record(monotonic() - start, self.click_wait_time)
     
-    def get_text(self, element):
+    def get_text(self, element, single_call=False):
         if not element:
             return None
 
+        if single_call:
+            return self.get_texts([element])[0]
+
         result = self.normalise_text(element.text)
 
         if len(result) == 0:
@@ -310,6 +894,32 @@ class SeleniumHelper:
                 result = self.get_innerHtml(element)
         
         return result
+
+    def get_texts(self, elements):
+        from selenium.webdriver.remote.webelement import WebElement
+
+        present = [e for e in elements if e]
+
+        if not present:
+            return [None for e in elements]
+
+        if not isinstance(present[0], WebElement):
+            return [self.get_text(e) for e in elements]
+
+        candidates = iter(self.driver.execute_script(TEXT_SCRIPT, present))
+
+        return [self.resolve_text(next(candidates)) if e else None for e in elements]
+
+    def resolve_text(self, candidates):
+        result = ''
+
+        for c in candidates:
+            result = self.normalise_text(c)
+
+            if len(result) > 0:
+                break
+
+        return result
     
     def get_href(self, element):
         if element:
@@ -328,12 +938,18 @@ class SeleniumHelper:
         return ' '.join(with_removed_tags.split()).strip()
 
     def get_innerHtml(self, element):
-        return self.normalise_text(self.driver.execute_script("return arguments[0].innerHTML", element))
+        return self.normalise_text(element.get_property("innerHTML"))
 
     def save_screenshot(self, path):    
         self.driver.save_screenshot(path)
 
     def email_screenshot(self):
+        import smtplib
+        from email.encoders import encode_base64
+        from email.mime.base import MIMEBase
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
         msg = MIMEMultipart()
         msg['Subject'] = 'Your Requested Screenshot from Selenium'
         msg['To'] = self.email_address
@@ -359,18 +975,82 @@ class SeleniumHelper:
         s.quit()
 
     def close(self):
-        if self.quitter:
-            self.driver.quit()
-        else:
-            self.driver.close()
+        try:
+            try:
+                self.download_tracker.close()
+            except WebDriverException as e:
+                logging.warning(f'Failed to close the downloads tab: {e}')
+
+            if self.quitter:
+                self.driver.quit()
+            else:
+                self.driver.close()
+
+        finally:
+            if self.command_recorder is not None:
+                self.command_recorder.close()
+
+
+class BackgroundDriver:
+    # Starts a driver on another thread and stands in for it, so that the
+    # caller can get on with other work.  The first use of the driver
+    # waits for it to start, and raises any error from starting it.
+    def __init__(self, start_driver):
+        self._result = None
+        self._error = None
+        self._started = False
+        self._start_hooks = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._start, args=(start_driver,), daemon=True)
+        self._thread.start()
+
+    def _start(self, start_driver):
+        try:
+            self._result = start_driver()
+        except BaseException as e:
+            self._error = e
+
+        with self._lock:
+            self._started = True
+
+            if self._error is None:
+                for hook in self._start_hooks:
+                    hook(self._result)
+
+    def add_start_hook(self, hook):
+        # Calls hook with the driver once it has started
+        with self._lock:
+            if not self._started:
+                self._start_hooks.append(hook)
+                return
+
+        if self._error is None:
+            hook(self._result)
 
+    def resolve(self):
+        self._thread.join()
 
-def get_selenium(helper_class=SeleniumHelper, base_url=None):
+        if self._error is not None:
+            raise self._error
+
+        return self._result
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+def get_selenium(helper_class=SeleniumHelper, base_url=None, background=None, download_directory=None):
     if not base_url:
         base_url=os.environ.get("BASE_URL", "")
 
+    if download_directory is None:
+        download_directory = os.environ["DOWNLOAD_DIRECTORY"]
+
+    if background is None:
+        background = bool(os.environ.get("SELENIUM_BACKGROUND_START", False))
+
     args = dict(
-        download_directory=os.environ["DOWNLOAD_DIRECTORY"],
+        download_directory=str(download_directory),
         output_directory=os.environ["OUTPUT_DIRECTORY"],
         base_url=base_url,
         implicit_wait_time=float(os.environ.get("IMPLICIT_WAIT_TIME", 1)),
@@ -380,8 +1060,18 @@ def get_selenium(helper_class=SeleniumHelper, base_url=None):
         email_address=os.environ["EMAIL_ADDRESS"],
         compare_version=os.environ.get("COMPARE_VERSION", "0.0"),
         version=os.environ.get("VERSION", "0.0"),
+        unzip_workers=int(os.environ.get("UNZIP_WORKERS", 4)),
+        session_state_filepath=os.environ.get("SESSION_STATE_FILE"),
+        session_state_max_age=float(os.environ["SESSION_STATE_MAX_AGE"]) if os.environ.get("SESSION_STATE_MAX_AGE") else None,
+        background=background,
+        scrape_cache_size=int(float(os.environ.get("SCRAPE_CACHE_SIZE", 0)) * 1024 * 1024),
     )
 
+    if os.environ.get("COMMAND_TRACE_DIRECTORY"):
+        from lbrc_selenium.instrumentation import CommandRecorder
+
+        args['command_recorder'] = CommandRecorder(os.environ["COMMAND_TRACE_DIRECTORY"])
+
     if os.environ.get("SELENIUM_HOST", None):
         return get_selenium_grid_helper(
             helper_class=helper_class,
@@ -398,7 +1088,9 @@ def get_selenium(helper_class=SeleniumHelper, base_url=None):
         )
 
 
-def get_selenium_grid_helper(helper_class, download_directory, selenium_host, selenium_port, implicit_wait_time, options = None, **kwargs):
+def get_selenium_grid_helper(helper_class, download_directory, selenium_host, selenium_port, implicit_wait_time, options = None, background=False, **kwargs):
+    from selenium import webdriver
+
     if options is None:
         options = webdriver.ChromeOptions()
 
@@ -406,20 +1098,24 @@ def get_selenium_grid_helper(helper_class, download_directory, selenium_host, se
     # options['acceptInsecureCerts'] = True
     # options['acceptSslCerts'] = True
 
-    driver = webdriver.Remote(
-        command_executor=f'http://{selenium_host}:{selenium_port}/wd/hub',
-        options=options,
-    )
+    def start_driver():
+        return webdriver.Remote(
+            command_executor=f'http://{selenium_host}:{selenium_port}/wd/hub',
+            options=options,
+        )
 
     return helper_class(
-        driver=driver,
+        driver=BackgroundDriver(start_driver) if background else start_driver(),
         download_directory=download_directory,
         quitter=True,
         **kwargs,
     )
 
 
-def get_selenium_local_helper(helper_class, download_directory, implicit_wait_time, firefox_binary=None, headless=True, **kwargs):
+def get_selenium_local_helper(helper_class, download_directory, implicit_wait_time, firefox_binary=None, headless=True, background=False, **kwargs):
+    from selenium import webdriver
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
     profile = webdriver.FirefoxProfile()
     profile.set_preference("browser.download.folderList", 2)
     profile.set_preference("browser.download.manager.showWhenStarting", False)
@@ -434,12 +1130,15 @@ def get_selenium_local_helper(helper_class, download_directory, implicit_wait_ti
     if firefox_binary is not None:
         options.binary = firefox_binary
 
-    driver = webdriver.Firefox(options=options)
-    driver.implicitly_wait(implicit_wait_time)
+    def start_driver():
+        driver = webdriver.Firefox(options=options)
+        driver.implicitly_wait(implicit_wait_time)
+        return driver
 
     return helper_class(
-        driver=driver,
+        driver=BackgroundDriver(start_driver) if background else start_driver(),
         download_directory=download_directory,
+        download_tracker=LocalDownloadTracker(download_directory),
         **kwargs,
     )
 
@@ -456,79 +1155,171 @@ class Translator:
         self.translations[from_value] = to_value
 
 
+@dataclass(frozen=True)
+class ResolvedTranslations:
+    columns: frozenset
+    label_translations: dict
+    value_translations: dict
+
+
+class TranslationPlan:
+    def __init__(self, keys: tuple, resolved: ResolvedTranslations):
+        self.keys = keys
+        self.value_translations = resolved.value_translations
+
+        # The input key that each output key takes its value from.  A later
+        # input key that is translated to the same output key replaces
+        # the value, but not the position, of the earlier one.
+        sources = {}
+
+        for k in keys:
+            out = resolved.label_translations.get(k, k)
+
+            if resolved.columns is not None and out not in resolved.columns:
+                continue
+
+            sources[out] = k
+
+        self.mapping = [(out, sources[out]) for out in sorted(sources, key=str)]
+
+    def apply(self, input: dict):
+        vt = self.value_translations
+
+        if not vt:
+            return OrderedDict([(out, input[k]) for out, k in self.mapping])
+
+        result = OrderedDict()
+
+        for out, k in self.mapping:
+            v = input[k]
+
+            if isinstance(v, typing.Hashable) and v in vt:
+                v = vt[v]
+
+            result[out] = v
+
+        return result
+
+
 class VersionTranslator:
+    MAX_PLANS = 1024
+
     def __init__(self) -> None:
         self.columns: dict = {}
         self.label_translations: dict = {}
         self.value_translations: dict = {}
+        self._sorted_versions: dict = {}
+        self._resolved: dict = {}
+        self._plans: dict = {}
+        self._fingerprints: dict = {}
 
     def set_columns_for_version(self, ver: str, column_names: set):
-        cv = version.parse(ver)
+        cv = parse_version(ver)
         self.columns[cv] = column_names
+        self._changed()
 
     def add_column(self, ver: str, column_name: str):
-        cv = version.parse(ver)
+        cv = parse_version(ver)
         self.columns[cv].append(column_name)
+        self._changed()
 
     def set_label_translators_for_version(self, ver: str, translations: dict):
-        cv = version.parse(ver)
+        cv = parse_version(ver)
         self.label_translations[cv] = translations
+        self._changed()
     
     def add_label_translator(self, ver: str, from_value: str, to_value: str):
-        cv = version.parse(ver)
+        cv = parse_version(ver)
         self.label_translations[cv][from_value] = to_value
+        self._changed()
     
     def set_value_translators_for_version(self, ver: str, translations: dict):
-        cv = version.parse(ver)
+        cv = parse_version(ver)
         self.value_translations[cv] = translations
+        self._changed()
     
     def add_value_translator(self, ver: str, from_value: str, to_value: str):
-        cv = version.parse(ver)
+        cv = parse_version(ver)
         self.value_translations[cv][from_value] = to_value
+        self._changed()
+
+    def _changed(self):
+        self._sorted_versions.clear()
+        self._resolved.clear()
+        self._plans.clear()
+        self._fingerprints.clear()
+
+    def resolve(self, ver: str):
+        if ver not in self._resolved:
+            ct = self._get_version(ver, self.columns)
+
+            self._resolved[ver] = ResolvedTranslations(
+                columns=frozenset(ct) if ct else None,
+                label_translations=self._get_version(ver, self.label_translations) or {},
+                value_translations=self._get_version(ver, self.value_translations) or {},
+            )
+
+        return self._resolved[ver]
     
-    def translate_dictionary(self, ver: str, input: dict):
-        ct: list = self._get_version(ver, self.columns)
-        lt: dict = self._get_version(ver, self.value_translations)
-        vt: dict = self._get_version(ver, self.value_translations)
+    def fingerprint(self, ver: str):
+        # Identifies the translations used for ver, so that results
+        # translated with them can be cached
+        if ver not in self._fingerprints:
+            resolved = self.resolve(ver)
 
-        result = OrderedDict()
+            self._fingerprints[ver] = cache_key(
+                sorted(resolved.columns) if resolved.columns is not None else None,
+                sorted(resolved.label_translations.items()),
+                sorted(resolved.value_translations.items(), key=str),
+            )
 
-        for k, v in input.items():
-            if lt and k in lt.keys():
-                k = lt[k]
+        return self._fingerprints[ver]
 
-            if ct and k not in ct:
-                continue
+    def get_plan(self, ver: str, keys: tuple):
+        if (ver, keys) not in self._plans:
+            if len(self._plans) >= self.MAX_PLANS:
+                self._plans.clear()
 
-            if isinstance(v, typing.Hashable) and vt and v in vt.keys():
-                v = lt[v]
-            
-            result[k] = v
-        
-        result = OrderedDict({key: value for key, value in sorted(result.items(), key=lambda i: str(i[0]))})
+            self._plans[(ver, keys)] = TranslationPlan(keys, self.resolve(ver))
 
-        return result
+        return self._plans[(ver, keys)]
+
+    def translate_dictionary(self, ver: str, input: dict):
+        return self.get_plan(ver, tuple(input)).apply(input)
+
+    def translate_dictionaries(self, ver: str, inputs):
+        plan = None
+
+        for input in inputs:
+            keys = tuple(input)
+
+            if plan is None or plan.keys != keys:
+                plan = self.get_plan(ver, keys)
+
+            yield plan.apply(input)
 
     def cleanse_headers(self, ver: str, headers: list):
-        ct: list = self._get_version(ver, self.columns) or headers
+        ct = self.resolve(ver).columns
 
         result = {}
 
         for i, h in enumerate(headers):
-            if h in ct:
+            if ct is None or h in ct:
                 result[str(i)] = h
        
         return result
 
     def _get_version(self, ver: str, versions: dict):
-        cv = version.parse(ver)
-        pre_versions = [k for k in versions.keys() if k <= cv]
+        if id(versions) not in self._sorted_versions:
+            self._sorted_versions[id(versions)] = sorted(versions.keys())
+
+        sorted_versions = self._sorted_versions[id(versions)]
+        i = bisect_right(sorted_versions, parse_version(ver))
 
-        if not pre_versions:
+        if i == 0:
             return None
         
-        latest_version = max(pre_versions)
-        return versions[latest_version]
+        return versions[sorted_versions[i - 1]]
 
 @dataclass(frozen=True, eq=True)
 class Link:
@@ -540,23 +1331,50 @@ class Link:
 
 
 class Scrubber:
-    def __init__(self, helper: SeleniumHelper, version_comparator: VersionTranslator=None) -> None:
+    def __init__(self, helper: SeleniumHelper, version_comparator: VersionTranslator=None, snapshot: bool=False) -> None:
         self.helper = helper
         self.version_comparator = version_comparator or VersionTranslator()
+        self.snapshot = snapshot
 
     def get_details(self):
-        parents = self.helper.get_elements(self.parent_selector)
-
-        if len(parents) > 0:
-            return self._scrape_details(parents[0])
+        if self.snapshot:
+            parents = self.helper.get_elements(self.parent_selector, element=self.helper.get_snapshot())
         else:
+            parents = self.helper.get_elements(self.parent_selector)
+
+        if len(parents) == 0:
             return None
+
+        if self.helper.scrape_cache is None:
+            return self._scrape_details(parents[0])
+
+        key = self.cache_key(parents[0])
+        found, result = self.helper.scrape_cache.get(key)
+
+        if not found:
+            result = self._scrape_details(parents[0])
+            self.helper.scrape_cache.put(key, result)
+
+        return result
+
+    def cache_key(self, parent):
+        configuration = {k: v for k, v in vars(self).items() if k not in ('helper', 'version_comparator')}
+
+        return cache_key(
+            type(self).__module__,
+            type(self).__qualname__,
+            configuration,
+            self.helper.driver.current_url,
+            self.helper.compare_version,
+            self.version_comparator.fingerprint(self.helper.compare_version),
+            parent.get_property('outerHTML'),
+        )
     
     def _scrape_details(self, parent):
         return []
     
     def get_value(self, parent, header=''):
-        elements = sorted(self.helper.get_elements(self.value_selector, element=parent), key=lambda x: x.tag_name)
+        elements = self.helper.get_elements(self.value_selector, element=parent)
         parents = self.get_parent_elements(elements, header)
 
         if len(parents) > 0:
@@ -571,29 +1389,34 @@ class Scrubber:
 
     def get_element_contents(self, element):
         if element.tag_name == 'a':
-            href = self.helper.get_href(element)
-            name = self.helper.get_text(element)
+            return self._link_contents(self.helper.get_href(element), self.helper.get_text(element))
+        else:
+            return self.cleanse(self.helper.get_text(element))
 
-            if not href and not name:
-                return None
+    def get_extracted_value(self, extracted):
+        contents = self.get_extracted_contents(extracted['contents'])
 
-            return str(Link(href=self.cleanse(href), name=self.cleanse(name)))
+        if extracted['resolved']:
+            return '; '.join(str(vv) for vv in set(filter(None, [contents])))
         else:
-            return self.cleanse(self.helper.get_text(element))
+            return contents
 
-    def get_parent_elements(self, elements, header):
-        results = []
+    def get_extracted_contents(self, contents):
+        text = self.helper.resolve_text(contents['text'])
+
+        if contents['tag'] == 'a':
+            return self._link_contents((contents['href'] or '').strip(), text)
+        else:
+            return self.cleanse(text)
 
-        for e in elements:
-            ancestors = self.helper.get_elements(XpathSelector('.//ancestor-or-self::*'), element=e)
-            ancestors.remove(e)
-            intersection = list(set(ancestors) & set(elements))
+    def _link_contents(self, href, name):
+        if not href and not name:
+            return None
 
-            if len(intersection) == 0:
-                results.append(e)
-                break
+        return str(Link(href=self.cleanse(href), name=self.cleanse(name)))
 
-        return results
+    def get_parent_elements(self, elements, header):
+        return self.helper.get_unnested_elements(elements, sort_by_tag_name=True)[:1]
 
 class KeyValuePairScrubber(Scrubber):
     def __init__(self, 
@@ -603,8 +1426,9 @@ class KeyValuePairScrubber(Scrubber):
                  key_selector: Selector=None,
                  value_selector: Selector=None,
                  version_comparator: VersionTranslator=None,
+                 snapshot: bool=False,
                  ) -> None:
-        super().__init__(helper, version_comparator)
+        super().__init__(helper, version_comparator, snapshot)
         
         self.parent_selector = parent_selector or CssSelector('ul')
         self.pair_selector = pair_selector or CssSelector('li')
@@ -614,9 +1438,11 @@ class KeyValuePairScrubber(Scrubber):
     def _scrape_details(self, parent):
         details = {}
 
-        for kvpair in self.helper.get_elements(self.pair_selector, element=parent):
-            title = self.helper.get_element(self.key_selector, element=kvpair, allow_null=True)
-            header = self.cleanse(self.helper.get_text(title))
+        kvpairs = self.helper.get_elements(self.pair_selector, element=parent)
+        titles = [self.helper.get_element(self.key_selector, element=kvpair, allow_null=True) for kvpair in kvpairs]
+
+        for kvpair, title in zip(kvpairs, self.helper.get_texts(titles)):
+            header = self.cleanse(title)
 
             if header:
                 details[header] = self.get_value(kvpair)
@@ -629,8 +1455,9 @@ class ListScrubber(Scrubber):
                  helper: SeleniumHelper,
                  parent_selector: Selector=None,
                  value_selector: Selector=None,
-                 version_comparator: VersionTranslator=None) -> None:
-        super().__init__(helper, version_comparator)
+                 version_comparator: VersionTranslator=None,
+                 snapshot: bool=False) -> None:
+        super().__init__(helper, version_comparator, snapshot)
         
         self.parent_selector = parent_selector or CssSelector('ul')
         self.value_selector = value_selector or CssSelector('li')
@@ -652,19 +1479,25 @@ class TableScrubber(Scrubber):
                  row_selector: Selector=None,
                  cell_selector: Selector=None,
                  value_selector: Selector=None,
-                 version_comparator: VersionTranslator=None) -> None:
-        super().__init__(helper, version_comparator)
+                 version_comparator: VersionTranslator=None,
+                 snapshot: bool=False,
+                 single_call: bool=False) -> None:
+        super().__init__(helper, version_comparator, snapshot)
         
         self.parent_selector = parent_selector or CssSelector('table')
         self.header_selector = header_selector or CssSelector('thead tr th')
         self.row_selector = row_selector or CssSelector('tbody tr')
         self.cell_selector = cell_selector or CssSelector('td')
         self.value_selector = value_selector or CssSelector('span, a')
+        self.single_call = single_call
 
     def _scrape_details(self, parent):
+        if self.single_call and not self.snapshot:
+            return self._scrape_details_single_call(parent)
+
         result = []
 
-        headers = [self.helper.get_text(h) for h in self.helper.get_elements(self.header_selector, element=parent)]
+        headers = self.helper.get_texts(self.helper.get_elements(self.header_selector, element=parent))
 
         headers = self.version_comparator.cleanse_headers(self.helper.compare_version, headers)
 
@@ -678,6 +1511,43 @@ class TableScrubber(Scrubber):
                 header = self.cleanse(headers[str(i)])
                 details[header] = self.get_value(cell, header=header)
 
-            result.append(self.version_comparator.translate_dictionary(self.helper.compare_version, details))
+            result.append(details)
+
+        return self._translate_rows(result)
+
+    def _scrape_details_single_call(self, parent):
+        result = []
+
+        extracted = self.helper.driver.execute_script(
+            TABLE_EXTRACT_SCRIPT,
+            parent,
+            {
+                'header': self.header_selector.script_argument(),
+                'row': self.row_selector.script_argument(),
+                'cell': self.cell_selector.script_argument(),
+                'value': self.value_selector.script_argument(),
+            },
+        )
+
+        headers = [self.helper.resolve_text(h) for h in extracted['headers']]
+
+        headers = self.version_comparator.cleanse_headers(self.helper.compare_version, headers)
+
+        for row in extracted['rows']:
+            details = {}
+
+            for i, cell in enumerate(row):
+                if str(i) not in headers:
+                    continue
+
+                header = self.cleanse(headers[str(i)])
+                details[header] = self.get_extracted_value(cell)
+
+            result.append(details)
+
+        return self._translate_rows(result)
+
+    def _translate_rows(self, rows):
+        result = self.version_comparator.translate_dictionaries(self.helper.compare_version, rows)
 
         return sorted(result, key=lambda d: [str(v) for v in d.values()])
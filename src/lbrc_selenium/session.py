@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from time import time
+from urllib.parse import urlsplit
+from selenium.common.exceptions import WebDriverException
+from lbrc_selenium.atomic import atomic_write
+
+
+STORAGE_SCRIPT = '''
+function contents(storage) {
+    var result = {};
+
+    for (var i = 0; i < storage.length; i++) {
+        var key = storage.key(i);
+        result[key] = storage.getItem(key);
+    }
+
+    return result;
+}
+
+return [contents(window.localStorage), contents(window.sessionStorage)];
+'''
+
+RESTORE_STORAGE_SCRIPT = '''
+for (const [key, value] of Object.entries(arguments[0])) {
+    window.localStorage.setItem(key, value);
+}
+for (const [key, value] of Object.entries(arguments[1])) {
+    window.sessionStorage.setItem(key, value);
+}
+'''
+
+
+def origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}/'
+
+
+@dataclass
+class SessionState:
+    url: str
+    saved_at: float
+    cookies: list = field(default_factory=list)
+    local_storage: dict = field(default_factory=dict)
+    session_storage: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_driver(cls, driver, url=None):
+        # Saved for the origin of url, which should be the current page's
+        local_storage, session_storage = driver.execute_script(STORAGE_SCRIPT)
+
+        return cls(
+            url=origin(url or driver.current_url),
+            saved_at=time(),
+            cookies=driver.get_cookies(),
+            local_storage=local_storage,
+            session_storage=session_storage,
+        )
+
+    @classmethod
+    def load(cls, filepath):
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                return cls(**json.load(f))
+
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logging.warning(f'Ignoring unreadable session state {filepath}: {e}')
+            return None
+
+    def save(self, filepath):
+        # Written to a temporary file that only the owner can read, and
+        # then swapped in, so that pooled sessions saving at the same
+        # time cannot leave a partial file.
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        with atomic_write(filepath, unique=True) as partial_filepath:
+            fd = os.open(partial_filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+            with open(fd, 'w', encoding='utf-8') as f:
+                json.dump(asdict(self), f)
+
+    def live_cookies(self, now=None):
+        now = now or time()
+        return [c for c in self.cookies if 'expiry' not in c or c['expiry'] > now]
+
+    def is_expired(self, max_age=None):
+        # A state without cookies or storage cannot hold a login
+        if not (self.cookies or self.local_storage or self.session_storage):
+            return True
+
+        if max_age is not None and time() - self.saved_at > max_age:
+            return True
+
+        # Every cookie that the login set has since expired
+        return bool(self.cookies) and not self.live_cookies()
+
+    def apply(self, driver):
+        # Cookies can only be set for the domain of the current page
+        driver.get(self.url)
+        driver.delete_all_cookies()
+
+        for c in self.live_cookies():
+            c = {k: v for k, v in c.items() if v is not None}
+
+            if 'expiry' in c:
+                c['expiry'] = int(c['expiry'])
+
+            try:
+                driver.add_cookie(c)
+            except WebDriverException as e:
+                logging.debug(f'Could not restore cookie {c.get("name")}: {e}')
+
+        driver.execute_script(RESTORE_STORAGE_SCRIPT, self.local_storage, self.session_storage)
@@ -0,0 +1,232 @@
+import re
+from pathlib import Path
+from urllib.parse import urljoin
+import lxml.html
+from lxml import etree
+from lxml.cssselect import CSSSelector
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+from lbrc_selenium.selenium import Selector
+
+
+# Elements that start on a new line in the browser's rendered text
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'caption', 'dd', 'details',
+    'dialog', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer',
+    'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hgroup', 'hr',
+    'legend', 'li', 'main', 'nav', 'ol', 'option', 'p', 'pre', 'section',
+    'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul',
+])
+NOT_RENDERED_TAGS = frozenset([
+    'head', 'link', 'meta', 'noscript', 'script', 'style', 'template', 'title',
+])
+VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'source', 'track', 'wbr',
+])
+RAW_TEXT_TAGS = frozenset([
+    'iframe', 'noembed', 'noframes', 'noscript', 'plaintext', 'script', 'style',
+    'xmp',
+])
+TEXT_PROPERTY_TAGS = frozenset(['a', 'option', 'script', 'title'])
+URL_PROPERTY_TAGS = frozenset(['a', 'area', 'base', 'link'])
+
+RE_HIDDEN_STYLE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+
+
+def _is_element(node):
+    return isinstance(node, etree._Element) and isinstance(node.tag, str)
+
+
+def _is_hidden(node):
+    if not _is_element(node) or node.tag in NOT_RENDERED_TAGS or 'hidden' in node.attrib:
+        return True
+
+    if node.tag == 'input' and node.get('type', '').lower() == 'hidden':
+        return True
+
+    return bool(RE_HIDDEN_STYLE.search(node.get('style', '')))
+
+
+def _visible_text(node, parts):
+    if node.tag == 'br':
+        parts.append('\n')
+        return
+
+    block = node.tag in BLOCK_TAGS
+
+    if block:
+        parts.append('\n')
+
+    if node.text:
+        parts.append(node.text)
+
+    for child in node:
+        if not _is_hidden(child):
+            _visible_text(child, parts)
+
+        if child.tail:
+            parts.append(child.tail)
+
+    if block:
+        parts.append('\n')
+
+
+def _escape(value, attribute=False):
+    value = value.replace('&', '&amp;').replace('\xa0', '&nbsp;')
+
+    if attribute:
+        return value.replace('"', '&quot;')
+    else:
+        return value.replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _inner_html(node):
+    raw = node.tag in RAW_TEXT_TAGS
+    parts = []
+
+    if node.text:
+        parts.append(node.text if raw else _escape(node.text))
+
+    for child in node:
+        parts.append(_outer_html(child))
+
+        if child.tail:
+            parts.append(child.tail if raw else _escape(child.tail))
+
+    return ''.join(parts)
+
+
+def _outer_html(node):
+    if node.tag is etree.Comment:
+        return f'<!--{node.text or ""}-->'
+
+    if not _is_element(node):
+        return ''
+
+    attributes = ''.join(f' {k}="{_escape(v, attribute=True)}"' for k, v in node.attrib.items())
+
+    if node.tag in VOID_TAGS:
+        return f'<{node.tag}{attributes}>'
+    else:
+        return f'<{node.tag}{attributes}>{_inner_html(node)}</{node.tag}>'
+
+
+class DomSnapshot:
+    def __init__(self, page_source, current_url=''):
+        self.page_source = page_source
+        self.current_url = current_url
+
+        self.root = lxml.html.document_fromstring(
+            page_source.encode('utf-8'),
+            parser=lxml.html.HTMLParser(encoding='utf-8'),
+        )
+
+        base = self.root.find('.//base[@href]')
+        self.base_url = urljoin(current_url, base.get('href').strip()) if base is not None else current_url
+
+        self._elements = {}
+        self._css_matches = {}
+
+    @classmethod
+    def from_driver(cls, driver):
+        return cls(driver.page_source, driver.current_url)
+
+    @classmethod
+    def from_file(cls, path, current_url=''):
+        return cls(Path(path).read_text(encoding='utf-8'), current_url)
+
+    def element(self, node):
+        if node not in self._elements:
+            self._elements[node] = SnapshotElement(self, node)
+
+        return self._elements[node]
+
+    def find_element(self, by=By.ID, value=None):
+        return self._first(self.find_elements(by, value), by, value)
+
+    def find_elements(self, by=By.ID, value=None):
+        if by == By.XPATH:
+            return self._xpath(self.root, value)
+
+        matches = self._css_match(by, value)
+        return [self.element(n) for n in self.root.iter() if n in matches]
+
+    def _first(self, elements, by, value):
+        if not elements:
+            raise NoSuchElementException(f'Unable to locate element: {by}={value}')
+
+        return elements[0]
+
+    def _xpath(self, node, query):
+        return [self.element(n) for n in node.xpath(query) if _is_element(n)]
+
+    def _css_match(self, by, query):
+        # Matches for the whole document, as querySelectorAll matches
+        # selectors against the whole document and not just the context
+        query = Selector(query, by).script_argument()['query']
+
+        if query not in self._css_matches:
+            self._css_matches[query] = set(CSSSelector(query, translator='html')(self.root))
+
+        return self._css_matches[query]
+
+
+class SnapshotElement:
+    def __init__(self, snapshot, node):
+        self.snapshot = snapshot
+        self.node = node
+
+    @property
+    def tag_name(self):
+        return self.node.tag.lower()
+
+    @property
+    def parent_element(self):
+        parent = self.node.getparent()
+
+        if parent is not None:
+            return self.snapshot.element(parent)
+
+    @property
+    def text(self):
+        if not self.is_displayed():
+            return ''
+
+        parts = []
+        _visible_text(self.node, parts)
+        return ''.join(parts)
+
+    def is_displayed(self):
+        return not any(_is_hidden(n) for n in [self.node, *self.node.iterancestors()])
+
+    def get_attribute(self, name):
+        if name == 'href' and self.tag_name in URL_PROPERTY_TAGS:
+            href = self.node.get('href')
+            return '' if href is None else urljoin(self.snapshot.base_url, href.strip())
+        if name == 'text' and self.tag_name in TEXT_PROPERTY_TAGS:
+            return self.node.text_content()
+        if name == 'value' and self.tag_name == 'textarea':
+            return self.node.text_content()
+
+        return self.node.get(name)
+
+    def get_property(self, name):
+        if name == 'innerHTML':
+            return _inner_html(self.node)
+        if name == 'outerHTML':
+            return _outer_html(self.node)
+        if name == 'textContent':
+            return self.node.text_content()
+
+        return self.get_attribute(name)
+
+    def find_element(self, by=By.ID, value=None):
+        return self.snapshot._first(self.find_elements(by, value), by, value)
+
+    def find_elements(self, by=By.ID, value=None):
+        if by == By.XPATH:
+            return self.snapshot._xpath(self.node, value)
+
+        matches = self.snapshot._css_match(by, value)
+        return [self.snapshot.element(n) for n in self.node.iterdescendants() if n in matches]